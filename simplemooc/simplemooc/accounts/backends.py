@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from simplemooc.core.db import read_from_primary
+
+from .cache import get_user, set_user
+
+
+class CachedModelBackend(ModelBackend):
+    """``ModelBackend`` que lê do cache o usuário da sessão.
+
+    A ``AuthenticationMiddleware`` chama ``get_user`` em toda requisição
+    autenticada; com o usuário no cache ela não consulta o banco. O
+    ``post_save``/``post_delete`` de ``User`` (troca de senha, edição da
+    conta, ``last_login``) remove a cópia do cache. O hash da senha não vai
+    para o cache: a cópia guarda o hash da sessão, usado na verificação da
+    ``AuthenticationMiddleware``.
+    """
+
+    def get_user(self, user_id):
+        user = get_user(user_id)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                with read_from_primary():
+                    user = UserModel._default_manager.get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            set_user(user)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,60 @@
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+USER_TIMEOUT = 60 * 60 * 24
+
+# Guardado no lugar da senha: é o que a AuthenticationMiddleware compara
+# com o hash gravado na sessão.
+SESSION_HASH = 'session_auth_hash'
+
+
+def user_key(user_id):
+    return 'accounts:user:%s' % user_id
+
+
+def _cache():
+    return caches[settings.ACCOUNTS_USER_CACHE_ALIAS]
+
+
+def _fields(model):
+    return [field.attname for field in model._meta.concrete_fields
+            if field.attname != 'password']
+
+
+def _session_auth_hash(user, cached):
+    # Com a senha carregada (troca de senha na própria requisição) o hash
+    # é calculado de novo.
+    if 'password' in user.__dict__:
+        return type(user).get_session_auth_hash(user)
+    return cached
+
+
+def get_user(user_id):
+    """Usuário do cache, com a senha adiada (lida do banco se usada)."""
+    data = _cache().get(user_key(user_id))
+    if data is None:
+        return None
+    model = get_user_model()
+    fields = _fields(model)
+    if any(field not in data for field in fields):
+        return None
+    user = model.from_db(
+        DEFAULT_DB_ALIAS, fields, [data[field] for field in fields])
+    user.get_session_auth_hash = partial(
+        _session_auth_hash, user, data[SESSION_HASH])
+    return user
+
+
+def set_user(user):
+    """Guarda os campos do usuário, menos o hash da senha."""
+    data = {field: getattr(user, field) for field in _fields(type(user))}
+    data[SESSION_HASH] = user.get_session_auth_hash()
+    _cache().set(user_key(user.pk), data, USER_TIMEOUT)
+
+
+def invalidate_user(user_id):
+    _cache().delete(user_key(user_id))
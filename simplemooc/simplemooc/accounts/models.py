@@ -3,9 +3,14 @@ import re
 from django.db import models
 from django.core import validators
 from django.contrib.auth.models import (AbstractBaseUser, PermissionsMixin,
-UserManager)
+UserManager, update_last_login)
 
 from django.conf import settings
+from django.contrib.auth.signals import user_logged_in
+
+from simplemooc.core.db import background_writes
+
+from .cache import invalidate_user
 
 class User(AbstractBaseUser, PermissionsMixin):
     username = models.CharField(
@@ -56,3 +61,24 @@ class PasswordReset(models.Model):
 
     def __str__(self):
         return f'{0} em {1}'.format(self.user, self.created_at)
+
+
+def clear_user_cache(instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+models.signals.post_save.connect(
+    clear_user_cache, sender=User, dispatch_uid='post_save_user')
+models.signals.post_delete.connect(
+    clear_user_cache, sender=User, dispatch_uid='post_delete_user')
+
+
+def update_last_login_in_background(sender, user, **kwargs):
+    with background_writes():
+        update_last_login(sender, user, **kwargs)
+
+
+# Substitui o receiver conectado por django.contrib.auth.models.
+user_logged_in.disconnect(update_last_login)
+user_logged_in.connect(
+    update_last_login_in_background, dispatch_uid='update_last_login')
@@ -1,3 +1,64 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
-# Create your tests here.
+from model_mommy import mommy
+
+from simplemooc.accounts.cache import user_key
+from simplemooc.accounts.models import User
+
+
+class CachedAuthenticationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make("accounts.User", name="Ana")
+        self.user.set_password("123")
+        self.user.save()
+        self.client.login(username=self.user.username, password="123")
+        self.url = reverse("accounts:dashboard")
+
+    def test_warm_dashboard_without_queries(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, "Bem-vindo, Ana")
+
+        self.user.name = "Ana Maria"
+        self.user.save()
+        self.assertContains(self.client.get(self.url), "Bem-vindo, Ana Maria")
+
+    def test_password_change_ends_other_sessions(self):
+        self.client.get(self.url)
+        self.user.set_password("456")
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_password_hash_not_cached(self):
+        self.client.get(self.url)
+        cached = caches[settings.ACCOUNTS_USER_CACHE_ALIAS].get(
+            user_key(self.user.pk))
+        self.assertNotIn("password", cached)
+        self.assertNotIn(self.user.password, cached.values())
+
+    def test_edit_with_cached_user_keeps_password(self):
+        self.client.get(self.url)
+        response = self.client.post(reverse("accounts:edit"), {
+            "username": self.user.username, "email": "ana@simplemooc.org",
+            "name": "Ana Maria"})
+        self.assertRedirects(response, self.url)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.name, "Ana Maria")
+        self.assertTrue(user.check_password("123"))
+        self.assertContains(self.client.get(self.url), "Bem-vindo, Ana Maria")
+
+    def test_change_password_with_cached_user(self):
+        self.client.get(self.url)
+        response = self.client.post(reverse("accounts:edit_password"), {
+            "old_password": "123", "new_password1": "nova-senha-456",
+            "new_password2": "nova-senha-456"})
+        self.assertTrue(response.context["success"])
+        self.assertTrue(
+            User.objects.get(pk=self.user.pk).check_password(
+                "nova-senha-456"))
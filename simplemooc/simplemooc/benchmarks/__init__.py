@@ -0,0 +1,5 @@
+"""Benchmarks do simplemooc.
+
+Cada módulo expõe uma função ``run`` que devolve um dicionário com os
+resultados e é executado por um comando ``benchmark_*`` de manage.py.
+"""
@@ -0,0 +1,60 @@
+"""Custo do painel (``accounts:dashboard``) para um usuário logado.
+
+Compara a sessão no banco com ``ModelBackend`` (o padrão do Django) com a
+sessão ``cached_db`` e o ``CachedModelBackend``, contando as consultas e o
+tempo de uma requisição com os caches já aquecidos.
+"""
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from model_mommy import mommy
+
+from .utils import temporary_caches, test_database, timed
+
+CONFIGURATIONS = [
+    ('sessão no banco + ModelBackend', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': [
+            'django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('cached_db + CachedModelBackend', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': [
+            'simplemooc.accounts.backends.CachedModelBackend'],
+    }),
+]
+
+
+def _measure(name, user, url, requests):
+    caches['default'].clear()
+    client = Client()
+    client.force_login(user)
+    client.get(url)
+    # O request_started limpa o log de consultas; ele precisa começar vazio.
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200, response.status_code
+    _, seconds = timed(lambda: client.get(url), requests)
+    return {
+        'name': name,
+        'queries': len(queries),
+        'sql': [query['sql'] for query in queries],
+        'seconds': seconds,
+    }
+
+
+def run(requests=200, courses=5):
+    results = []
+    with test_database(), temporary_caches():
+        user = mommy.make('accounts.User', name='Aluno')
+        for course in mommy.make('courses.Course', _quantity=courses):
+            mommy.make('courses.Enrollment', user=user, course=course,
+                       status=1)
+        url = reverse('accounts:dashboard')
+        for name, overrides in CONFIGURATIONS:
+            with override_settings(**overrides):
+                results.append(_measure(name, user, url, requests))
+    return results
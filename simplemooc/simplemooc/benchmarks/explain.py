@@ -0,0 +1,137 @@
+"""Planos de execução (EXPLAIN) das consultas mais frequentes.
+
+Gera dados num banco de testes descartável, roda ``ANALYZE`` e guarda o
+plano de cada consulta junto com o índice que ela deveria usar, para
+comparar entre versões do esquema.
+"""
+import datetime
+import random
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+from model_mommy import mommy
+
+from simplemooc.courses.models import Announcement, Course, Enrollment, Lesson
+from simplemooc.forum.models import Thread
+
+from .utils import test_database, timed
+
+
+def _index_name(model, fields):
+    for index in model._meta.indexes:
+        if index.fields == fields:
+            return index.name
+    raise LookupError('%s não tem índice em %s' % (model.__name__, fields))
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' \
+        else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if connection.vendor == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def _seed(courses, threads, seed):
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    Course.objects.bulk_create(mommy.prepare(
+        'courses.Course', _quantity=courses,
+        slug=lambda: 'curso-%d' % rng.getrandbits(48)))
+    course_ids = list(Course.objects.values_list('pk', flat=True))
+
+    Lesson.objects.bulk_create([
+        Lesson(course_id=course_id, name='Aula %d' % number, number=number,
+               release_date=today + datetime.timedelta(days=rng.randint(-30, 30)))
+        for course_id in course_ids for number in range(20)
+    ])
+    Announcement.objects.bulk_create([
+        Announcement(course_id=course_id, title='Anúncio', content='...')
+        for course_id in course_ids for _ in range(10)
+    ])
+
+    User = get_user_model()
+    User.objects.bulk_create(mommy.prepare(
+        'accounts.User', _quantity=courses * 5,
+        username=lambda: 'aluno%d' % rng.getrandbits(48),
+        email=lambda: 'aluno%d@simplemooc.org' % rng.getrandbits(48)))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    Enrollment.objects.bulk_create([
+        Enrollment(user_id=user_id, course_id=course_id,
+                   status=rng.choice([0, 1, 1, 1, 2]))
+        for course_id in course_ids
+        for user_id in rng.sample(user_ids, min(50, len(user_ids)))
+    ])
+
+    author = user_ids[0]
+    Thread.objects.bulk_create([
+        Thread(title='Tópico %d' % index, slug='topico-%d' % index,
+               body='...', author_id=author, views=rng.randint(0, 10000),
+               answers=rng.randint(0, 100))
+        for index in range(threads)
+    ])
+    # O auto_now deixa todos com a mesma data; espalha ao longo de um ano.
+    first = Thread.objects.order_by('pk').values_list('pk', flat=True)[0]
+    step = max(threads // 365, 1)
+    for day in range(365):
+        start = first + day * step
+        Thread.objects.filter(pk__gte=start, pk__lt=start + step).update(
+            modified=today - datetime.timedelta(days=day))
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return course_ids
+
+
+def _next_page(field, per_page=20):
+    # Mesma consulta que o CursorPaginator do fórum faz a partir da
+    # segunda página: WHERE (campo, id) < (...) ORDER BY campo, id LIMIT n.
+    queryset = Thread.objects.order_by('-%s' % field, '-pk')
+    last = queryset[per_page - 1]
+    value = getattr(last, field)
+    return queryset.filter(
+        Q(**{'%s__lt' % field: value}) | Q(**{field: value, 'pk__lt': last.pk})
+    )[:per_page + 1]
+
+
+def queries(course_id, slug):
+    """``(nome, queryset, índice esperado)`` dos caminhos quentes."""
+    return [
+        ('curso por slug', Course.objects.filter(slug=slug), 'slug'),
+        ('árvore de aulas', Lesson.objects.filter(course_id=course_id),
+         _index_name(Lesson, ['course', 'number'])),
+        ('anúncios do curso', Announcement.objects.feed_queryset(course_id),
+         _index_name(Announcement, ['course', 'created_at'])),
+        ('destinatários dos anúncios', Enrollment.objects.filter(
+            course_id=course_id, status=1).values_list('user__email'),
+         _index_name(Enrollment, ['course', 'status'])),
+    ] + [
+        ('fórum por %s' % field, _next_page(field),
+         _index_name(Thread, [field, 'id']))
+        for field in ('modified', 'views', 'answers')
+    ]
+
+
+def run(courses=500, threads=20000, repeat=20, seed=42):
+    results = []
+    with test_database():
+        course_ids = _seed(courses, threads, seed)
+        course = Course.objects.only('slug').get(pk=course_ids[0])
+        for name, queryset, index in queries(course.pk, course.slug):
+            plan = explain(queryset)
+            _, seconds = timed(lambda: list(queryset._clone()), repeat)
+            results.append({
+                'name': name,
+                'sql': str(queryset.query),
+                'plan': plan,
+                'index': index,
+                'uses_index': any(index in line for line in plan),
+                'seconds': seconds,
+            })
+    return results
@@ -0,0 +1,63 @@
+"""Vazão do envio de e-mails com template usando o backend locmem."""
+import time
+
+from django.core import mail
+from django.test.utils import override_settings
+
+from simplemooc.core.mail import send_mail_template, send_mass_mail_template
+
+LOCMEM_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+TEMPLATE_NAME = 'courses/announcement_mail.html'
+
+
+def _context(index):
+    return {'announcement': {'content': 'Anúncio número %d' % index}}
+
+
+def _measure(label, messages, func):
+    mail.outbox = []
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    assert len(mail.outbox) == messages
+    return {
+        'name': label,
+        'messages': messages,
+        'seconds': elapsed,
+        'messages_per_second': messages / elapsed if elapsed else 0.0,
+    }
+
+
+def run(messages=1000, batch_size=100):
+    recipients = ['aluno%d@simplemooc.com' % i for i in range(messages)]
+    shared_context = _context(0)
+
+    def one_by_one():
+        for index, email in enumerate(recipients):
+            send_mail_template('Anúncio', TEMPLATE_NAME, _context(index),
+                               [email])
+
+    def mass_per_recipient():
+        send_mass_mail_template(
+            'Anúncio', TEMPLATE_NAME,
+            ((_context(index), [email])
+             for index, email in enumerate(recipients)),
+            batch_size=batch_size
+        )
+
+    def mass_shared_context():
+        send_mass_mail_template(
+            'Anúncio', TEMPLATE_NAME,
+            ((shared_context, [email]) for email in recipients),
+            batch_size=batch_size
+        )
+
+    with override_settings(EMAIL_BACKEND=LOCMEM_BACKEND):
+        results = [
+            _measure('send_mail_template', messages, one_by_one),
+            _measure('send_mass_mail_template', messages, mass_per_recipient),
+            _measure('send_mass_mail_template (contexto único)', messages,
+                     mass_shared_context),
+        ]
+    mail.outbox = []
+    return results
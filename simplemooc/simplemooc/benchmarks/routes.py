@@ -0,0 +1,425 @@
+"""Latência e vazão de todas as rotas nomeadas do projeto.
+
+Gera um conjunto de dados grande (milhares de cursos, aulas e materiais,
+100 mil inscrições, tópicos do fórum com muitas respostas) num banco de
+testes descartável e faz GET em cada rota de ``core``, ``courses``,
+``forum`` e ``accounts`` com o client de testes do Django, em várias
+threads ao mesmo tempo. O resultado (``run``) é um dicionário que pode ser
+gravado em JSON e comparado com o de outra execução (``compare``).
+
+As consultas e o tempo de banco por requisição vêm do cabeçalho
+``Server-Timing`` do ``RequestMetricsMiddleware``.
+"""
+import datetime
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.urlresolvers import get_resolver, reverse
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from model_mommy import mommy
+
+from simplemooc.accounts.models import PasswordReset, User
+from simplemooc.core import search
+from simplemooc.courses.models import (Announcement, Comment, Course,
+                                       Enrollment, Lesson, Material)
+from simplemooc.forum.counters import thread_views
+from simplemooc.forum.models import Reply, Thread
+
+from .utils import temporary_caches, test_database
+
+NAMESPACES = ('core', 'courses', 'forum', 'accounts')
+
+# Quem faz a requisição: visitante, aluno inscrito no curso ou equipe.
+ANONYMOUS, STUDENT, STAFF = 'anonymous', 'student', 'staff'
+
+# ``writes``: a rota grava no banco a cada requisição.
+Route = namedtuple('Route', 'name url user writes')
+Route.__new__.__defaults__ = (False,)
+
+SERVER_TIMING_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) ')
+
+# Tamanho do conjunto de dados com ``scale=1``.
+DATASET = {
+    'courses': 2000,
+    'lessons_per_course': 10,
+    'materials_per_lesson': 2,
+    'users': 10000,
+    'enrollments_per_user': 10,
+    'announcements_per_course': 3,
+    'threads': 2000,
+    'large_threads': 20,
+    'replies_per_large_thread': 1000,
+    'replies_per_thread': 5,
+}
+
+
+def _sized(scale):
+    return {key: max(int(value * scale), 1) for key, value in DATASET.items()}
+
+
+def seed(sizes, media_root, seed=42):
+    """Popula o banco; retorna os objetos usados para montar as URLs."""
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    password = make_password('123')
+
+    User.objects.bulk_create(mommy.prepare(
+        'accounts.User', _quantity=sizes['users'], password=password,
+        username=lambda: 'aluno%d' % rng.getrandbits(48),
+        email=lambda: 'aluno%d@simplemooc.org' % rng.getrandbits(48)))
+    user_ids = list(User.objects.values_list('pk', flat=True))
+    student = User.objects.get(pk=user_ids[0])
+    staff = mommy.make('accounts.User', is_staff=True, password=password)
+
+    Course.objects.bulk_create(mommy.prepare(
+        'courses.Course', _quantity=sizes['courses'],
+        name=lambda: 'Curso de Python %d' % rng.getrandbits(16),
+        slug=lambda: 'curso-%d' % rng.getrandbits(48)))
+    course_ids = list(Course.objects.values_list('pk', flat=True))
+    course = Course.objects.get(pk=course_ids[0])
+
+    # Aulas liberadas: a data de liberação ainda não passou.
+    Lesson.objects.bulk_create([
+        Lesson(course_id=course_id, name='Aula %d' % number, number=number,
+               description='Conteúdo da aula de Python',
+               release_date=today + datetime.timedelta(days=30))
+        for course_id in course_ids
+        for number in range(sizes['lessons_per_course'])
+    ])
+    lesson_ids = list(Lesson.objects.values_list('pk', flat=True))
+    Material.objects.bulk_create([
+        Material(lesson_id=lesson_id, name='Vídeo %d' % number,
+                 embedded='<iframe src="https://example.com/%d"></iframe>'
+                 % lesson_id)
+        for lesson_id in lesson_ids
+        for number in range(sizes['materials_per_lesson'])
+    ])
+    lesson = course.lessons.order_by('number')[0]
+    material = lesson.materials.all()[0]
+    file_name = 'lessons/materials/apostila.pdf'
+    os.makedirs(os.path.join(media_root, os.path.dirname(file_name)))
+    with open(os.path.join(media_root, file_name), 'wb') as pdf:
+        pdf.write(b'%PDF-1.4\n' + b'0' * 200 * 1024)
+    download = Material.objects.create(
+        lesson=lesson, name='Apostila', file=file_name)
+
+    enrollments = {(user_ids[0], course.pk)}
+    for user_id in user_ids:
+        for course_id in rng.sample(
+                course_ids, min(sizes['enrollments_per_user'],
+                                len(course_ids))):
+            enrollments.add((user_id, course_id))
+    Enrollment.objects.bulk_create([
+        Enrollment(user_id=user_id, course_id=course_id, status=1)
+        for user_id, course_id in enrollments
+    ])
+
+    Announcement.objects.bulk_create([
+        Announcement(course_id=course_id, title='Anúncio %d' % number,
+                     content='Bem-vindos ao curso')
+        for course_id in course_ids
+        for number in range(sizes['announcements_per_course'])
+    ])
+    announcement = course.announcements.all()[0]
+    Comment.objects.bulk_create([
+        Comment(announcement=announcement, user_id=rng.choice(user_ids),
+                comment='Obrigado!')
+        for _ in range(50)
+    ])
+
+    Thread.objects.bulk_create(mommy.prepare(
+        'forum.Thread', _quantity=sizes['threads'], author=staff,
+        title=lambda: 'Dúvida sobre Python %d' % rng.getrandbits(16),
+        slug=lambda: 'topico-%d' % rng.getrandbits(48),
+        views=lambda: rng.randint(0, 10000),
+        answers=lambda: rng.randint(0, 100)))
+    thread_ids = list(Thread.objects.values_list('pk', flat=True))
+    large = set(thread_ids[:sizes['large_threads']])
+    Reply.objects.bulk_create([
+        Reply(thread_id=thread_id, author_id=rng.choice(user_ids),
+              reply='Resposta sobre Python')
+        for thread_id in thread_ids
+        for _ in range(sizes['replies_per_large_thread']
+                       if thread_id in large
+                       else sizes['replies_per_thread'])
+    ])
+    thread = Thread.objects.get(pk=thread_ids[0])
+    thread.tags.add('python')
+    reply = thread.replies.all()[0]
+
+    reset = PasswordReset.objects.create(user=student, key='bench%d' % seed)
+
+    for model in search.registered_models():
+        search.rebuild(model)
+
+    return {
+        'student': student, 'staff': staff, 'course': course,
+        'lesson': lesson, 'material': material, 'download': download,
+        'announcement': announcement, 'thread': thread, 'reply': reply,
+        'reset': reset,
+    }
+
+
+def routes(objects):
+    slug = objects['course'].slug
+    thread = objects['thread']
+    return [
+        Route('core:home', reverse('core:home'), ANONYMOUS),
+        Route('core:contact', reverse('core:contact'), ANONYMOUS),
+        Route('core:search', reverse('core:search') + '?q=python', STUDENT),
+        Route('core:request_metrics', reverse('core:request_metrics'), STAFF),
+        Route('core:cache_metrics', reverse('core:cache_metrics'), STAFF),
+        Route('courses:index', reverse('courses:index'), ANONYMOUS),
+        Route('courses:details', reverse('courses:details', args=[slug]),
+              ANONYMOUS),
+        Route('courses:enrollment',
+              reverse('courses:enrollment', args=[slug]), STUDENT),
+        Route('courses:undo_enrollment',
+              reverse('courses:undo_enrollment', args=[slug]), STUDENT),
+        Route('courses:announcements',
+              reverse('courses:announcements', args=[slug]), STUDENT),
+        Route('courses:show_announcement', reverse(
+            'courses:show_announcement',
+            args=[slug, objects['announcement'].pk]), STUDENT),
+        Route('courses:lessons', reverse('courses:lessons', args=[slug]),
+              STUDENT),
+        Route('courses:lesson', reverse(
+            'courses:lesson', args=[slug, objects['lesson'].pk]), STUDENT),
+        Route('courses:material', reverse(
+            'courses:material', args=[slug, objects['material'].pk]),
+            STUDENT),
+        Route('courses:material_download', reverse(
+            'courses:material_download',
+            args=[slug, objects['download'].pk]), STUDENT),
+        Route('forum:index', reverse('forum:index'), ANONYMOUS),
+        Route('forum:index_tagged',
+              reverse('forum:index_tagged', args=['python']), ANONYMOUS),
+        Route('forum:thread', thread.get_absolute_url(), ANONYMOUS),
+        Route('forum:reply_correct', reverse(
+            'forum:reply_correct', args=[objects['reply'].pk]), STAFF, True),
+        Route('forum:reply_incorrect', reverse(
+            'forum:reply_incorrect', args=[objects['reply'].pk]), STAFF,
+            True),
+        Route('accounts:dashboard', reverse('accounts:dashboard'), STUDENT),
+        Route('accounts:login', reverse('accounts:login'), ANONYMOUS),
+        Route('accounts:logout', reverse('accounts:logout'), ANONYMOUS),
+        Route('accounts:register', reverse('accounts:register'), ANONYMOUS),
+        Route('accounts:edit', reverse('accounts:edit'), STUDENT),
+        Route('accounts:edit_password', reverse('accounts:edit_password'),
+              STUDENT),
+        Route('accounts:password_reset', reverse('accounts:password_reset'),
+              ANONYMOUS),
+        Route('accounts:password_reset_confirm', reverse(
+            'accounts:password_reset_confirm',
+            args=[objects['reset'].key]), ANONYMOUS),
+    ]
+
+
+def named_urls():
+    """Nomes de todas as rotas dos apps em ``NAMESPACES``."""
+    resolver = get_resolver()
+    names = set()
+    for namespace in NAMESPACES:
+        _, namespace_resolver = resolver.namespace_dict[namespace]
+        names.update(
+            '%s:%s' % (namespace, name)
+            for name in namespace_resolver.reverse_dict
+            if isinstance(name, str))
+    return names
+
+
+def percentile(values, fraction):
+    """Percentil pelo método do posto mais próximo."""
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(int(round(fraction * len(values) + 0.5)) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def _client(user):
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    return client
+
+
+def _worker(route, user, requests, samples, errors, spans, barrier):
+    try:
+        client = _client(user)
+        client.get(route.url)
+    except Exception as exc:
+        errors.append(repr(exc))
+        barrier.abort()
+        connections.close_all()
+        return
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            response = client.get(route.url)
+        except Exception as exc:
+            errors.append(repr(exc))
+            continue
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+            continue
+        match = SERVER_TIMING_RE.search(response.get('Server-Timing', ''))
+        samples.append((
+            elapsed * 1000,
+            int(match.group(2)) if match else None,
+            float(match.group(1)) if match else None,
+        ))
+    spans.append((started, time.perf_counter()))
+    connections.close_all()
+
+
+def measure(route, user, requests, concurrency):
+    samples, errors, spans = [], [], []
+    barrier = threading.Barrier(concurrency)
+    threads = [
+        threading.Thread(target=_worker, args=(
+            route, user, requests, samples, errors, spans, barrier))
+        for _ in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Cada thread marca o próprio início (depois da primeira requisição, com
+    # os caches aquecidos) e fim; o intervalo vai do primeiro início ao
+    # último fim, sem o tempo de criar e encerrar as threads.
+    elapsed = (max(end for _, end in spans) -
+               min(start for start, _ in spans)) if spans else None
+
+    latencies = [sample[0] for sample in samples]
+    queries = [sample[1] for sample in samples if sample[1] is not None]
+    db_ms = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'url': route.url,
+        'user': route.user,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': len(errors),
+        'error_samples': [str(error) for error in errors[:3]],
+        'throughput_rps': len(samples) / elapsed if elapsed else None,
+        'mean_ms': sum(latencies) / len(latencies) if latencies else None,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+        'queries': max(queries) if queries else None,
+        'db_ms': sum(db_ms) / len(db_ms) if db_ms else None,
+    }
+
+
+def run(scale=1.0, requests=50, concurrency=4, only=None, seed_value=42):
+    sizes = _sized(scale)
+    directory = tempfile.mkdtemp(prefix='simplemooc_routes_')
+    media_root = os.path.join(directory, 'media')
+    # Com SQLite o banco em arquivo aceita leituras de várias threads.
+    name = os.path.join(directory, 'bench.sqlite3') \
+        if connection.vendor == 'sqlite' else None
+    try:
+        with test_database(name), temporary_caches(), override_settings(
+                MEDIA_ROOT=media_root, SENDFILE_ROOT=media_root,
+                SENDFILE_BACKEND=None, DEBUG=False,
+                SERVER_TIMING_PUBLIC=True):
+            start = time.perf_counter()
+            objects = seed(sizes, media_root, seed_value)
+            seed_seconds = time.perf_counter() - start
+            # As threads abrem conexões próprias com o banco de testes.
+            connections.close_all()
+
+            users = {ANONYMOUS: None, STUDENT: objects['student'],
+                     STAFF: objects['staff']}
+            selected = [route for route in routes(objects)
+                        if not only or route.name in only]
+            results = {}
+            for route in selected:
+                # O SQLite só aceita uma escrita por vez: as rotas que gravam
+                # rodam numa thread só.
+                threads = 1 if route.writes and \
+                    connection.vendor == 'sqlite' else concurrency
+                results[route.name] = measure(
+                    route, users[route.user], requests, threads)
+            uncovered = sorted(
+                named_urls() - {route.name for route in routes(objects)})
+            # Grava as visualizações pendentes antes de apagar o banco.
+            thread_views.flush()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        'meta': {
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': scale,
+            'dataset': sizes,
+            'requests_per_thread': requests,
+            'concurrency': concurrency,
+            'seed_seconds': seed_seconds,
+            'created_at': datetime.datetime.utcnow().isoformat(),
+        },
+        'routes': results,
+        'uncovered': uncovered,
+    }
+
+
+# Métricas comparadas e se um valor maior é pior.
+COMPARED = (
+    ('p50_ms', True), ('p95_ms', True), ('p99_ms', True),
+    ('throughput_rps', False), ('queries', True),
+)
+
+
+def compare(old, new, threshold=0.10, min_ms=1.0):
+    """Diferenças por rota entre duas execuções de ``run``.
+
+    Uma métrica piorou quando variou mais que ``threshold`` (10%) no
+    sentido ruim; nas latências a diferença também precisa passar de
+    ``min_ms``, para não acusar o ruído das rotas de menos de 1ms. Qualquer
+    consulta a mais conta como piora.
+    """
+    rows = []
+    for name in sorted(set(old['routes']) | set(new['routes'])):
+        before = old['routes'].get(name)
+        after = new['routes'].get(name)
+        if before is None or after is None:
+            rows.append({'route': name, 'metric': None, 'old': None,
+                         'new': None, 'change': None,
+                         'regression': False,
+                         'note': 'nova' if before is None else 'removida'})
+            continue
+        for metric, higher_is_worse in COMPARED:
+            old_value, new_value = before.get(metric), after.get(metric)
+            if old_value is None or new_value is None:
+                continue
+            change = (new_value - old_value) / old_value if old_value \
+                else (0.0 if new_value == old_value else float('inf'))
+            worse = change if higher_is_worse else -change
+            if metric == 'queries':
+                regression = new_value > old_value
+            elif metric.endswith('_ms'):
+                regression = worse > threshold and \
+                    new_value - old_value > min_ms
+            else:
+                regression = worse > threshold
+            rows.append({'route': name, 'metric': metric, 'old': old_value,
+                         'new': new_value, 'change': change,
+                         'regression': regression, 'note': ''})
+    return rows
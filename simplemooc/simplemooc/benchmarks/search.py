@@ -0,0 +1,65 @@
+"""CourseManager.search (índice de busca) contra a busca antiga com icontains.
+
+Os cursos são gerados com o model_mommy num banco de testes descartável.
+"""
+import random
+
+from django.db.models import Q
+from model_mommy import mommy
+
+from simplemooc.core import search
+from simplemooc.courses.models import Course
+
+from .utils import test_database, timed
+
+WORDS = (
+    'python django web programação banco dados algoritmos redes segurança '
+    'estatística cálculo física química história música fotografia design '
+    'gestão marketing finanças inglês espanhol javascript rust linux nuvem '
+    'aprendizado máquina inteligência artificial introdução avançado prático'
+).split()
+
+QUERIES = ('python', 'programação', 'inteligencia artificial', 'redes linux',
+           'fotografia avançado', 'xyz')
+
+
+def _text(rng, size):
+    return ' '.join(rng.choice(WORDS) for _ in range(size))
+
+
+def icontains_search(query):
+    return Course.objects.filter(
+        Q(name__icontains=query) | Q(description__icontains=query))
+
+
+def run(courses=100000, limit=20, repeat=5, seed=42):
+    rng = random.Random(seed)
+    results = {'courses': courses, 'backend': None, 'queries': []}
+
+    with test_database():
+        batch = 5000
+        for start in range(0, courses, batch):
+            size = min(batch, courses - start)
+            Course.objects.bulk_create(mommy.prepare(
+                'courses.Course', _quantity=size,
+                name=lambda: _text(rng, 3), description=lambda: _text(rng, 30),
+                slug=lambda: 'curso-%d' % rng.getrandbits(48),
+            ))
+
+        _, results['index_seconds'] = timed(lambda: search.rebuild(Course))
+        results['backend'] = type(search.get_backend()).__name__
+
+        for query in QUERIES:
+            old_hits, old_seconds = timed(
+                lambda: list(icontains_search(query)[:limit]), repeat)
+            new_hits, new_seconds = timed(
+                lambda: list(Course.objects.search(query)[:limit]), repeat)
+            results['queries'].append({
+                'query': query,
+                'icontains_seconds': old_seconds,
+                'search_seconds': new_seconds,
+                'icontains_total': icontains_search(query).count(),
+                'search_total': Course.objects.search(query).count(),
+            })
+
+    return results
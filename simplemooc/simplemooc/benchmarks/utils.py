@@ -0,0 +1,53 @@
+import copy
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import override_settings
+
+
+@contextmanager
+def test_database(name=None):
+    """Cria um banco de testes descartável para o benchmark.
+
+    Os dados gerados nunca tocam o banco configurado em ``DATABASES``.
+    ``name`` troca o ``TEST['NAME']``; com SQLite, um arquivo em vez do
+    banco em memória permite acessos de várias threads ao mesmo tempo.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if name is not None:
+        test_settings['NAME'] = name
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+
+
+def timed(func, repeat=1):
+    """Executa ``func`` ``repeat`` vezes; retorna (resultado, segundos)."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return result, (time.perf_counter() - start) / repeat
+
+
+@contextmanager
+def temporary_caches():
+    """Caches em arquivo numa pasta temporária, longe dos do projeto."""
+    directory = tempfile.mkdtemp(prefix='simplemooc_bench_')
+    config = copy.deepcopy(settings.CACHES)
+    for alias in config.values():
+        if alias['BACKEND'].endswith('FileBasedCache'):
+            alias['LOCATION'] = directory
+    try:
+        with override_settings(CACHES=config):
+            yield
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,406 @@
+"""Cache em duas camadas com proteção contra estouro (stampede).
+
+``TieredCache`` é um backend de cache do Django: uma camada L1 em memória
+do processo, LRU e com TTL curto, na frente de um cache compartilhado L2
+(outro alias de ``CACHES``, indicado em ``LOCATION``)::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'simplemooc.core.cache.TieredCache',
+            'LOCATION': 'shared',
+            'OPTIONS': {'L1_MAX_ENTRIES': 1000, 'L1_TIMEOUT': 5},
+        },
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/var/tmp/simplemooc_cache',
+        },
+    }
+
+A L1 e os contadores são do processo: o Django cria uma instância do
+backend por thread, e todas as de um mesmo ``LOCATION`` e ``KEY_PREFIX``
+usam o mesmo estado, como o ``LocMemCache``. Uma remoção só limpa a L1 do
+próprio processo; nos demais o valor antigo dura no máximo ``L1_TIMEOUT``
+segundos.
+
+Chaves no formato ``app:...`` ganham a versão do namespace ``app``, então
+``invalidate_namespace('courses')`` descarta de uma vez tudo o que o app
+guardou.
+"""
+import math
+import pickle
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .db import read_from_primary
+
+NAMESPACE_KEY = 'namespace:%s'
+
+# Valor guardado no lugar de None, que o Django usa para "não encontrado".
+_MISSING = object()
+
+STAT_NAMES = (
+    'l1_hits', 'l2_hits', 'misses', 'sets', 'deletes', 'recomputes',
+    'early_recomputes', 'stale_hits', 'lock_waits',
+)
+
+# Contadores da requisição em andamento nesta thread (track_cache).
+_tracking = threading.local()
+
+# L1, contadores e travas de cada TieredCache, compartilhados pelas
+# instâncias das várias threads.
+_l1_caches = {}
+_stats = {}
+_stats_locks = {}
+_state_lock = threading.Lock()
+
+
+@contextmanager
+def track_cache():
+    """Conta os acessos ao cache feitos pela thread dentro do bloco."""
+    previous = getattr(_tracking, 'counts', None)
+    _tracking.counts = counts = Counter()
+    try:
+        yield counts
+    finally:
+        _tracking.counts = previous
+
+
+class LRUCache(object):
+    """Dicionário limitado a ``max_entries`` itens, cada um com validade."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires_at = item
+            if expires_at <= now:
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        super(TieredCache, self).__init__(params)
+        self._l2_alias = location
+        self.l1_timeout = float(options.get('L1_TIMEOUT', 5))
+        # Quanto tempo um processo espera por outro que está recalculando
+        # o mesmo valor antes de calcular por conta própria.
+        self.lock_timeout = float(options.get('LOCK_TIMEOUT', 10))
+        name = '%s:%s' % (location, self.key_prefix)
+        with _state_lock:
+            if name not in _l1_caches:
+                _l1_caches[name] = LRUCache(
+                    int(options.get('L1_MAX_ENTRIES', 1000)))
+                _stats[name] = dict.fromkeys(STAT_NAMES, 0)
+                _stats_locks[name] = threading.Lock()
+            self._l1 = _l1_caches[name]
+            self._stats = _stats[name]
+            self._stats_lock = _stats_locks[name]
+
+    @property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # Estatísticas
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.update(dict.fromkeys(STAT_NAMES, 0))
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+        counts = getattr(_tracking, 'counts', None)
+        if counts is not None:
+            counts[name] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        hits = stats['l1_hits'] + stats['l2_hits']
+        total = hits + stats['misses']
+        stats['hit_ratio'] = hits / total if total else None
+        stats['l1_entries'] = len(self._l1)
+        return stats
+
+    # Chaves
+
+    def namespace_version(self, namespace):
+        key = NAMESPACE_KEY % namespace
+        now = time.time()
+        version = self._l1.get(key, now)
+        if version is _MISSING:
+            version = self.l2.get(key)
+            if version is None:
+                # Baseada no relógio para nunca repetir uma versão antiga.
+                version = int(now * 1000)
+                if not self.l2.add(key, version, None):
+                    version = self.l2.get(key, version)
+            self._l1.set(key, version, now + self.l1_timeout)
+        return version
+
+    def invalidate_namespace(self, namespace):
+        key = NAMESPACE_KEY % namespace
+        self._l1.set(key, bump_version(key, self.l2),
+                     time.time() + self.l1_timeout)
+
+    def _key(self, key, version=None):
+        namespace, separator, _ = key.partition(':')
+        if separator:
+            key = '%s@%s' % (key, self.namespace_version(namespace))
+        return self.make_key(key, version=version)
+
+    def _l1_expiry(self, timeout, now):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return now + self.l1_timeout
+        return min(timeout, now + self.l1_timeout)
+
+    # L1 guarda o pickle, como o LocMemCache: quem altera o objeto lido
+    # não altera o que está no cache.
+
+    def _l1_get(self, key, now):
+        data = self._l1.get(key, now)
+        if data is _MISSING:
+            return _MISSING
+        return pickle.loads(data)
+
+    def _l1_set(self, key, value, timeout, now):
+        self._l1.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                     self._l1_expiry(timeout, now))
+
+    # API do BaseCache
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        value = self._l1_get(key, now)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+        value = self.l2.get(key, _MISSING)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(key, value, self.l1_timeout, now)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        for key, original in keys.items():
+            value = self._l1_get(key, now)
+            if value is not _MISSING:
+                found[original] = value
+        self._count('l1_hits', len(found))
+        missing = [key for key, original in keys.items()
+                   if original not in found]
+        if missing:
+            shared = self.l2.get_many(missing)
+            for key, value in shared.items():
+                found[keys[key]] = value
+                self._l1_set(key, value, self.l1_timeout, now)
+            self._count('l2_hits', len(shared))
+            self._count('misses', len(missing) - len(shared))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT \
+            else timeout
+        self.l2.set(key, value, timeout)
+        self._l1_set(key, value, timeout, time.time())
+        self._count('sets')
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key, value in data.items():
+            self.set(key, value, timeout, version)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT \
+            else timeout
+        if not self.l2.add(key, value, timeout):
+            return False
+        self._l1_set(key, value, timeout, time.time())
+        self._count('sets')
+        return True
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._l1.delete(key)
+        self.l2.delete(key)
+        self._count('deletes')
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        for key in keys:
+            self._l1.delete(key)
+        self.l2.delete_many(keys)
+        self._count('deletes', len(keys))
+
+    def incr(self, key, delta=1, version=None):
+        # Direto na L2, que é quem garante a atomicidade (memcached/Redis).
+        key = self._key(key, version)
+        value = self.l2.incr(key, delta)
+        self._l1_set(key, value, self.l1_timeout, time.time())
+        self._count('sets')
+        return value
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version) is not _MISSING
+
+    def clear(self):
+        self._l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    # Recalculo com proteção contra estouro
+
+    def get_or_compute(self, key, compute, timeout=DEFAULT_TIMEOUT, beta=1.0,
+                       version=None):
+        """Valor de ``key`` ou o resultado de ``compute()``, guardado.
+
+        ``compute`` lê do banco principal (``read_from_primary``).
+
+        Um só processo recalcula de cada vez; os demais devolvem o valor
+        anterior ou, sem ele, esperam o novo. O recálculo pode começar
+        antes de a chave expirar, com probabilidade que cresce perto do
+        fim do prazo e com o tempo que ``compute`` leva (XFetch, com
+        ``beta`` maior antecipa mais).
+        """
+        timeout = self.default_timeout if timeout is DEFAULT_TIMEOUT \
+            else timeout
+        entry = self.get(key, version=version)
+        if entry is not None:
+            value, delta, expires_at = entry
+            gap = -delta * beta * math.log(1.0 - random.random())
+            if time.time() + gap < expires_at:
+                return value
+
+        lock_key = '%s:lock' % key
+        if self.l2.add(self._key(lock_key, version), 1, self.lock_timeout):
+            try:
+                return self._compute(key, compute, timeout, version,
+                                     early=entry is not None)
+            finally:
+                self.l2.delete(self._key(lock_key, version))
+
+        if entry is not None:
+            self._count('stale_hits')
+            return entry[0]
+
+        self._count('lock_waits')
+        deadline = time.time() + self.lock_timeout
+        shared_key = self._key(key, version)
+        while time.time() < deadline:
+            time.sleep(0.05)
+            entry = self.l2.get(shared_key)
+            if entry is not None:
+                self._l1_set(shared_key, entry, self.l1_timeout, time.time())
+                return entry[0]
+        return self._compute(key, compute, timeout, version, early=False)
+
+    def _compute(self, key, compute, timeout, version, early):
+        self._count('early_recomputes' if early else 'recomputes')
+        start = time.time()
+        with read_from_primary():
+            value = compute()
+        now = time.time()
+        expires_at = float('inf') if timeout is None else now + timeout
+        self.set(key, (value, now - start, expires_at), timeout, version)
+        return value
+
+
+def bump_version(key, cache=None):
+    """Grava em ``key`` uma versão maior que a atual e a retorna.
+
+    O ``incr`` não repete o valor nem com duas invalidações no mesmo
+    milissegundo. Sem a chave, a versão recomeça pelo relógio em
+    milissegundos, maior que qualquer versão anterior (o ``incr`` dos caches
+    em arquivo e em memória do Django regrava a chave com o timeout padrão,
+    então ela pode expirar).
+    """
+    cache = cache or default_cache
+    try:
+        return cache.incr(key)
+    except ValueError:
+        pass
+    version = int(time.time() * 1000)
+    if cache.add(key, version, None):
+        return version
+    return cache.incr(key)
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT, cache=None):
+    """``TieredCache.get_or_compute`` em qualquer backend de cache.
+
+    Os valores ficam no formato de ``get_or_compute``; use sempre esta
+    função para ler essas chaves.
+    """
+    cache = cache or default_cache
+    if hasattr(cache, 'get_or_compute'):
+        return cache.get_or_compute(key, compute, timeout)
+    entry = cache.get(key)
+    if entry is not None:
+        return entry[0]
+    with read_from_primary():
+        value = compute()
+    cache.set(key, (value, 0, float('inf')), timeout)
+    return value
+
+
+def invalidate_namespace(namespace, cache=None):
+    cache = cache or default_cache
+    if hasattr(cache, 'invalidate_namespace'):
+        cache.invalidate_namespace(namespace)
+
+
+def cache_stats():
+    """``{alias: contadores}`` dos caches ``TieredCache`` deste processo,
+    somados de todas as threads."""
+    return {
+        alias: caches[alias].stats() for alias in settings.CACHES
+        if isinstance(caches[alias], TieredCache)
+    }
@@ -0,0 +1,135 @@
+"""Leituras nas réplicas (``settings.DATABASE_REPLICAS``).
+
+As consultas de leitura dos apps de ``settings.DATABASE_REPLICA_APPS`` vão
+para uma réplica sorteada. Depois de uma escrita, o restante da requisição
+e, por ``settings.DATABASE_STICKY_SECONDS`` segundos, as próximas
+requisições do mesmo navegador (cookie) leem do banco principal, para que
+o usuário veja a própria resposta mesmo com atraso na replicação.
+
+Leituras que vão para o cache usam ``read_from_primary``: os caches são
+limpos na escrita, e uma réplica atrasada os preencheria de novo com os
+dados antigos, para todos os usuários, até a chave expirar.
+
+Só as escritas que o usuário pediu prendem o navegador ao banco principal.
+As da sessão e as feitas dentro de ``background_writes`` (contadores,
+``last_login``) não prendem.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_COOKIE = 'primary_db'
+
+# Gravadas em quase toda requisição (SESSION_ENGINE cached_db); a sessão não
+# está em DATABASE_REPLICA_APPS e é sempre lida do banco principal.
+UNPINNED_MODELS = ('sessions.session',)
+
+_state = threading.local()
+
+
+def pin_primary():
+    _state.pinned = True
+
+
+def unpin_primary():
+    _state.pinned = False
+    _state.wrote = False
+
+
+def is_pinned():
+    return getattr(_state, 'pinned', False) or \
+        getattr(_state, 'primary_reads', 0) > 0
+
+
+@contextmanager
+def read_from_primary():
+    """Manda para o banco principal as leituras feitas dentro do bloco.
+
+    Também pode ser usado como decorador.
+    """
+    _state.primary_reads = getattr(_state, 'primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        _state.primary_reads -= 1
+
+
+@contextmanager
+def background_writes():
+    """As escritas feitas dentro do bloco não prendem o usuário ao banco
+    principal. Também pode ser usado como decorador.
+    """
+    _state.background = getattr(_state, 'background', 0) + 1
+    try:
+        yield
+    finally:
+        _state.background -= 1
+
+
+def _same_database(alias, other):
+    keys = ('ENGINE', 'NAME', 'HOST', 'PORT')
+    settings_dict = connections[alias].settings_dict
+    other_dict = connections[other].settings_dict
+    return all(settings_dict.get(key) == other_dict.get(key) for key in keys)
+
+
+def get_replicas():
+    # Uma réplica que aponta para o próprio banco principal (o MIRROR dos
+    # testes) é lida pela conexão principal, que enxerga a transação atual.
+    return [alias for alias in settings.DATABASE_REPLICAS
+            if not _same_database(alias, DEFAULT_DB_ALIAS)]
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if is_pinned() or \
+                model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return DEFAULT_DB_ALIAS
+        replicas = get_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if not getattr(_state, 'background', 0) and \
+                model._meta.label_lower not in UNPINNED_MODELS:
+            _state.wrote = True
+            pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [DEFAULT_DB_ALIAS] + list(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # As réplicas recebem o esquema pela replicação do banco principal.
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class PrimaryPinMiddleware(object):
+    """Mantém o usuário no banco principal logo depois de uma escrita."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        unpin_primary()
+        if STICKY_COOKIE in request.COOKIES:
+            pin_primary()
+        try:
+            response = self.get_response(request)
+            if getattr(_state, 'wrote', False):
+                response.set_cookie(
+                    STICKY_COOKIE, '1',
+                    max_age=settings.DATABASE_STICKY_SECONDS, httponly=True)
+        finally:
+            unpin_primary()
+        return response
@@ -1,19 +1,69 @@
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from django.template.defaultfilters import striptags
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
 
 
 def send_mail_template(subject, template_name, context, recipient_list,
                        from_email=settings.DEFAULT_FROM_EMAIL, fail_silently=False):
 
-    message_html = render_to_string(template_name, context)
-    message_text = striptags(message_html)
-
-    email = EmailMultiAlternatives(
-        subject=subject, body=message_text, from_email=from_email,
-        to=recipient_list
+    send_mass_mail_template(
+        subject, template_name, [(context, recipient_list)],
+        from_email=from_email, fail_silently=fail_silently
     )
 
-    email.attach_alternative(message_html, "text/html")
-    email.send(fail_silently=fail_silently)
+
+def send_mass_mail_template(subject, template_name, datatuple,
+                            from_email=settings.DEFAULT_FROM_EMAIL,
+                            fail_silently=False, batch_size=100,
+                            connection=None):
+    """Envia uma mensagem por item de ``datatuple`` (``(context,
+    recipient_list)``) usando uma única conexão para todos os lotes.
+
+    O template é carregado uma única vez e contextos repetidos (o mesmo
+    objeto) não são renderizados de novo. As mensagens são montadas em lotes
+    de ``batch_size`` e enviadas uma a uma pela conexão aberta, o que dá o
+    resultado de cada destinatário sem reenviar para quem já recebeu.
+    Retorna uma lista de ``(recipient_list, enviado)`` na ordem de
+    ``datatuple``.
+    """
+    template = get_template(template_name)
+    connection = connection or get_connection(fail_silently=fail_silently)
+    results = []
+
+    def send_batch(batch):
+        for message in batch:
+            try:
+                sent = bool(connection.send_messages([message]))
+            except Exception:
+                if not fail_silently:
+                    raise
+                sent = False
+            results.append((message.to, sent))
+
+    connection.open()
+    try:
+        last_context = message_html = message_text = None
+        batch = []
+        for context, recipient_list in datatuple:
+            if message_html is None or context is not last_context:
+                message_html = template.render(context)
+                message_text = striptags(message_html)
+                last_context = context
+
+            email = EmailMultiAlternatives(
+                subject=subject, body=message_text, from_email=from_email,
+                to=list(recipient_list), connection=connection
+            )
+            email.attach_alternative(message_html, "text/html")
+            batch.append(email)
+
+            if len(batch) >= batch_size:
+                send_batch(batch)
+                batch = []
+        if batch:
+            send_batch(batch)
+    finally:
+        connection.close()
+
+    return results
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from simplemooc.benchmarks import auth
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara consultas e tempo do painel do aluno com a sessão no banco '
+        'e com a sessão e o usuário no cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--courses', type=int, default=5)
+        parser.add_argument('--verbose-sql', action='store_true')
+
+    def handle(self, *args, **options):
+        results = auth.run(
+            requests=options['requests'], courses=options['courses'])
+        for result in results:
+            self.stdout.write('%-35s %3d consultas %8.3fms' % (
+                result['name'], result['queries'], result['seconds'] * 1000))
+            if options['verbose_sql']:
+                for sql in result['sql']:
+                    self.stdout.write('    %s' % sql)
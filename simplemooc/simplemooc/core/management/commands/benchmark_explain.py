@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simplemooc.benchmarks import explain
+
+
+class Command(BaseCommand):
+    help = (
+        'Mostra o plano de execução das consultas mais frequentes e confere '
+        'se cada uma usa o índice esperado.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--output', help='Grava os planos em JSON neste arquivo.')
+
+    def handle(self, *args, **options):
+        results = explain.run(
+            courses=options['courses'], threads=options['threads'],
+            repeat=options['repeat'])
+        for row in results:
+            self.stdout.write('%s (%.3fms) %s' % (
+                row['name'], row['seconds'] * 1000,
+                'OK' if row['uses_index'] else 'SEM ÍNDICE %s' % row['index']))
+            for line in row['plan']:
+                self.stdout.write('    %s' % line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+
+        missing = [row['name'] for row in results if not row['uses_index']]
+        if missing:
+            raise CommandError(
+                'Consultas sem o índice esperado: %s' % ', '.join(missing))
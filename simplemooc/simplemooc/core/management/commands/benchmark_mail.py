@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from simplemooc.benchmarks import mail
+
+
+class Command(BaseCommand):
+    help = 'Mede mensagens por segundo do envio de e-mails (backend locmem).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        results = mail.run(
+            messages=options['messages'], batch_size=options['batch_size'])
+        for result in results:
+            self.stdout.write(
+                '%(name)-45s %(messages)6d msgs %(seconds)8.3fs '
+                '%(messages_per_second)10.1f msgs/s' % result)
@@ -0,0 +1,77 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from simplemooc.benchmarks import routes
+
+
+class Command(BaseCommand):
+    help = (
+        'Mede latência (p50/p95/p99), vazão e consultas de cada rota nomeada '
+        'com um conjunto de dados grande e várias threads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scale', type=float, default=1.0,
+            help='Fração do conjunto de dados (1 = 100 mil inscrições).')
+        parser.add_argument('--requests', type=int, default=50,
+                            help='Requisições por thread em cada rota.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--route', action='append', dest='only',
+                            help='Só esta rota (pode repetir).')
+        parser.add_argument('--output', help='Grava o resultado em JSON.')
+        parser.add_argument(
+            '--compare', metavar='JSON',
+            help='Resultado anterior para comparar com esta execução.')
+        parser.add_argument('--threshold', type=float, default=0.10)
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help='Termina com erro se alguma rota piorar.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        results = routes.run(
+            scale=options['scale'], requests=options['requests'],
+            concurrency=options['concurrency'], only=options['only'])
+        self.stdout.write('Dados gerados em %.1fs: %s' % (
+            results['meta']['seed_seconds'], results['meta']['dataset']))
+        self.stdout.write('%-34s %8s %8s %8s %8s %9s %5s %4s' % (
+            'rota', 'req/s', 'p50', 'p95', 'p99', 'consultas', 'erros',
+            'user'))
+        for name, row in sorted(results['routes'].items()):
+            self.stdout.write('%-34s %8.1f %8s %8s %8s %9s %5d %s' % (
+                name, row['throughput_rps'] or 0, _ms(row['p50_ms']),
+                _ms(row['p95_ms']), _ms(row['p99_ms']),
+                '-' if row['queries'] is None else row['queries'],
+                row['errors'], row['user']))
+        if results['uncovered']:
+            self.stdout.write('Rotas sem medição: %s' % ', '.join(
+                results['uncovered']))
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2, ensure_ascii=False)
+
+        if baseline is None:
+            return
+        rows = routes.compare(baseline, results, options['threshold'])
+        regressions = [row for row in rows if row['regression']]
+        self.stdout.write('\nComparação com %s:' % options['compare'])
+        for row in rows:
+            if row['metric'] is None:
+                self.stdout.write('%-34s %s' % (row['route'], row['note']))
+                continue
+            self.stdout.write('%-34s %-15s %10.2f -> %10.2f %+7.1f%%%s' % (
+                row['route'], row['metric'], row['old'], row['new'],
+                row['change'] * 100, '  PIOROU' if row['regression'] else ''))
+        if regressions and options['fail_on_regression']:
+            raise CommandError('%d métricas pioraram.' % len(regressions))
+
+
+def _ms(value):
+    return '-' if value is None else '%.1fms' % value
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from simplemooc.benchmarks import search
+
+
+class Command(BaseCommand):
+    help = 'Compara a busca de cursos indexada com a busca por icontains.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100000)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        results = search.run(
+            courses=options['courses'], limit=options['limit'],
+            repeat=options['repeat'])
+        self.stdout.write(
+            '%(courses)d cursos, backend %(backend)s, indexação em '
+            '%(index_seconds).2fs' % results)
+        self.stdout.write('%-28s %12s %12s %8s %8s' % (
+            'consulta', 'icontains', 'search', 'total', 'total'))
+        for row in results['queries']:
+            self.stdout.write('%-28s %10.2fms %10.2fms %8d %8d' % (
+                row['query'], row['icontains_seconds'] * 1000,
+                row['search_seconds'] * 1000, row['icontains_total'],
+                row['search_total']))
@@ -0,0 +1,36 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from simplemooc.core import search
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice da busca lendo os objetos em lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*', metavar='app_label.Model',
+            help='Modelos a reindexar; por padrão todos os registrados.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Quantidade de objetos indexados por lote.'
+        )
+
+    def handle(self, *args, **options):
+        registered = search.registered_models()
+        models = registered
+        if options['models']:
+            try:
+                models = [apps.get_model(label) for label in options['models']]
+            except (LookupError, ValueError) as exc:
+                raise CommandError(exc)
+            for model in models:
+                if model not in registered:
+                    raise CommandError(
+                        '%s não está registrado na busca.' % model._meta.label)
+
+        for model in models:
+            total = search.rebuild(model, chunk_size=options['chunk_size'])
+            self.stdout.write('%s: %d documento(s) indexado(s).' % (
+                model._meta.label, total))
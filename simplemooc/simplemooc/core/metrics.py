@@ -0,0 +1,242 @@
+"""Tempo de cada requisição por view: banco, templates e cache.
+
+``RequestMetricsMiddleware`` mede a requisição inteira e devolve os números
+no cabeçalho ``Server-Timing`` (aparecem na aba de rede do navegador). Os
+tempos também vão para um histograma em memória por nome de URL
+(``courses:lesson``, ``forum:thread``...), lido em ``stats()``; cada
+processo tem o seu.
+
+O Django 1.11 não tem ``connection.execute_wrapper``: durante a requisição
+as conexões usam o cursor de debug e as consultas são lidas do
+``queries_log``. O tempo dos templates vem do backend
+``TimedDjangoTemplates`` (em ``settings.TEMPLATES``), que só mede durante
+uma requisição acompanhada pelo middleware.
+
+O cabeçalho expõe detalhes internos, então só sai com ``DEBUG``, para
+usuários da equipe ou com ``settings.SERVER_TIMING_PUBLIC``.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.urlresolvers import Resolver404, resolve
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from .cache import track_cache
+
+logger = logging.getLogger('simplemooc.slow_queries')
+
+# Limites (ms) das faixas do histograma; a última faixa não tem limite.
+BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_local = threading.local()
+
+
+class Recorder(object):
+    __slots__ = ('template_seconds', 'rendering')
+
+    def __init__(self):
+        self.template_seconds = 0.0
+        self.rendering = False
+
+
+@contextmanager
+def template_timer():
+    recorder = getattr(_local, 'recorder', None)
+    # Só o template de fora conta: os renderizados dentro dele já estão no
+    # tempo dele.
+    if recorder is None or recorder.rendering:
+        yield
+        return
+    recorder.rendering = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.template_seconds += time.perf_counter() - start
+        recorder.rendering = False
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with template_timer():
+            return super(TimedTemplate, self).render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` que soma o tempo de renderização à requisição."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class Histogram(object):
+    """Contagem por faixa de duração, para estimar percentis."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect_left(BUCKETS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction):
+        """Limite superior da faixa que contém o percentil."""
+        target = fraction * sum(self.counts)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return BUCKETS[index] if index < len(BUCKETS) else self.max
+        return None
+
+
+class ViewStats(object):
+
+    def __init__(self):
+        self.requests = 0
+        self.total = Histogram()
+        self.db_ms = 0.0
+        self.queries = 0
+        self.template_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'requests': self.requests,
+            'mean_ms': self.total.total / requests,
+            'p50_ms': self.total.percentile(0.5),
+            'p95_ms': self.total.percentile(0.95),
+            'p99_ms': self.total.percentile(0.99),
+            'max_ms': self.total.max,
+            'queries_per_request': self.queries / requests,
+            'db_ms_per_request': self.db_ms / requests,
+            'template_ms_per_request': self.template_ms / requests,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'buckets': dict(zip(
+                [str(limit) for limit in BUCKETS] + ['inf'],
+                self.total.counts)),
+        }
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record(view, total_ms, queries, db_ms, template_ms, hits, misses):
+    with _stats_lock:
+        stats = _stats.get(view)
+        if stats is None:
+            stats = _stats[view] = ViewStats()
+        stats.requests += 1
+        stats.total.add(total_ms)
+        stats.queries += queries
+        stats.db_ms += db_ms
+        stats.template_ms += template_ms
+        stats.cache_hits += hits
+        stats.cache_misses += misses
+
+
+def stats():
+    """``{nome da URL: números}`` das requisições deste processo."""
+    with _stats_lock:
+        return {view: stats.as_dict() for view, stats in _stats.items()}
+
+
+def reset():
+    with _stats_lock:
+        _stats.clear()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Respostas dadas por um middleware antes da view (cache de
+        # páginas, redirecionamentos).
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return 'sem_rota'
+    return match.view_name
+
+
+def show_server_timing(request):
+    if settings.DEBUG or settings.SERVER_TIMING_PUBLIC:
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def server_timing(total_ms, queries, db_ms, template_ms, hits, misses):
+    return ', '.join([
+        'db;dur=%.1f;desc="%d consultas"' % (db_ms, queries),
+        'tpl;dur=%.1f' % template_ms,
+        'cache;desc="%d hit %d miss"' % (hits, misses),
+        'total;dur=%.1f' % total_ms,
+    ])
+
+
+class RequestMetricsMiddleware(object):
+    """Deve ser o primeiro da lista, para medir os outros middlewares."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        aliases = [
+            (connection, connection.force_debug_cursor,
+             len(connection.queries_log))
+            for connection in connections.all()
+        ]
+        for connection, _, _ in aliases:
+            connection.force_debug_cursor = True
+        _local.recorder = recorder = Recorder()
+        start = time.perf_counter()
+        try:
+            with track_cache() as cache_counts:
+                response = self.get_response(request)
+        finally:
+            total_ms = (time.perf_counter() - start) * 1000
+            _local.recorder = None
+            executed = []
+            for connection, force_debug_cursor, first in aliases:
+                connection.force_debug_cursor = force_debug_cursor
+                executed.extend(list(connection.queries_log)[first:])
+
+        view = view_name(request)
+        db_ms = sum(float(query['time']) for query in executed) * 1000
+        template_ms = recorder.template_seconds * 1000
+        hits = cache_counts['l1_hits'] + cache_counts['l2_hits']
+        misses = cache_counts['misses']
+        record(view, total_ms, len(executed), db_ms, template_ms, hits, misses)
+        if show_server_timing(request):
+            response['Server-Timing'] = server_timing(
+                total_ms, len(executed), db_ms, template_ms, hits, misses)
+
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        for query in executed:
+            ms = float(query['time']) * 1000
+            if ms >= threshold:
+                logger.warning(
+                    'Consulta lenta (%.1fms) em %s %s: %s', ms, view,
+                    request.path, query['sql'])
+        return response
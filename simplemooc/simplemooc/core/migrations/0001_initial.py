@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(max_length=50, verbose_name='Tipo')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Objeto')),
+                ('course_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Curso')),
+                ('title', models.TextField(blank=True, verbose_name='Título')),
+                ('body', models.TextField(blank=True, verbose_name='Conteúdo')),
+            ],
+            options={
+                'verbose_name': 'Documento da Busca',
+                'verbose_name_plural': 'Documentos da Busca',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchdocument',
+            unique_together=set([('doc_type', 'object_id')]),
+        ),
+    ]
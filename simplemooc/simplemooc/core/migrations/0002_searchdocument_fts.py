@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:18
+from __future__ import unicode_literals
+
+from django.db import OperationalError, migrations
+
+
+FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE core_searchdocument_fts USING fts5(
+        title, body, content='core_searchdocument', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2')""",
+    """CREATE TRIGGER core_searchdocument_ai AFTER INSERT ON core_searchdocument
+    BEGIN
+        INSERT INTO core_searchdocument_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_ad AFTER DELETE ON core_searchdocument
+    BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER core_searchdocument_au AFTER UPDATE ON core_searchdocument
+    BEGIN
+        INSERT INTO core_searchdocument_fts(core_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO core_searchdocument_fts(rowid, title, body)
+        VALUES (new.id, new.title, new.body);
+    END""",
+]
+
+DROP_STATEMENTS = [
+    'DROP TRIGGER IF EXISTS core_searchdocument_au',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS core_searchdocument_ai',
+    'DROP TABLE IF EXISTS core_searchdocument_fts',
+]
+
+
+def create_fts(apps, schema_editor):
+    # Só no SQLite compilado com FTS5; nos outros bancos a busca usa o
+    # índice invertido em disco (simplemooc.core.search.backends).
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(FTS_STATEMENTS[0])
+        except OperationalError:
+            return
+        for statement in FTS_STATEMENTS[1:]:
+            cursor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in DROP_STATEMENTS:
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+# Cópia da análise de texto de simplemooc.core.search.text na época desta
+# migração: o código atual pode mudar, a migração não.
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre era essa esse esta este
+eu foi ha isso isto ja la mais mas me mesmo meu minha muito na nas nem no
+nos num numa o os ou para pela pelas pelo pelos por qual quando que quem
+se sem ser seu sua sao so tambem te tem um uma umas uns voce
+""".split())
+
+PLURAL_SUFFIXES = (
+    ('oes', 'ao'), ('aes', 'ao'), ('ais', 'al'), ('eis', 'el'),
+    ('res', 'r'), ('ses', 's'), ('zes', 'z'), ('ns', 'm'),
+)
+
+
+def stem(token):
+    if len(token) <= 3:
+        return token
+    for suffix, replacement in PLURAL_SUFFIXES:
+        if token.endswith(suffix):
+            return token[:-len(suffix)] + replacement
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(stem(token) for token in TOKEN_RE.findall(text)
+                    if token not in STOPWORDS)
+
+
+# (modelo, título, conteúdo, curso) como registrados na busca.
+INDEXED = [
+    ('courses.Course', 'name', 'description', None),
+    ('courses.Lesson', 'name', 'description', 'course_id'),
+    ('courses.Announcement', 'title', 'content', 'course_id'),
+    ('forum.Thread', 'title', 'body', None),
+    ('forum.Reply', None, 'reply', None),
+]
+
+CHUNK_SIZE = 1000
+
+INSERT_SQL = (
+    'INSERT INTO core_searchdocument '
+    '(doc_type, object_id, course_id, title, body) VALUES (%s, %s, %s, %s, %s)'
+)
+
+
+def backfill_index(apps, schema_editor):
+    # Cursos, aulas, anúncios e tópicos criados antes da busca por índice
+    # só entrariam nele com ``manage.py rebuild_index``. Só o FTS5 fica no
+    # banco; o índice invertido em disco, usado nos outros bancos, é montado
+    # com ``manage.py rebuild_index`` depois do migrate.
+    connection = schema_editor.connection
+    if 'core_searchdocument_fts' not in \
+            connection.introspection.table_names():
+        return
+
+    with connection.cursor() as cursor:
+        for label, title, body, course in INDEXED:
+            model = apps.get_model(label)
+            doc_type = model._meta.label_lower
+            cursor.execute(
+                'DELETE FROM core_searchdocument WHERE doc_type = %s',
+                [doc_type])
+            rows = model._default_manager.using(connection.alias).order_by(
+                'pk').values(*filter(None, ['pk', title, body, course]))
+            chunk = []
+            for row in rows.iterator():
+                chunk.append((
+                    doc_type, row['pk'], row[course] if course else None,
+                    normalize(row[title]) if title else '',
+                    normalize(row[body])))
+                if len(chunk) >= CHUNK_SIZE:
+                    cursor.executemany(INSERT_SQL, chunk)
+                    chunk = []
+            if chunk:
+                cursor.executemany(INSERT_SQL, chunk)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_searchdocument_fts'),
+        ('courses', '0011_announcementmail_progress'),
+        ('forum', '0004_thread_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_index, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,24 @@
 from django.db import models
 
-# Create your models here.
+
+class SearchDocument(models.Model):
+    """Texto já normalizado de um objeto indexado pela busca.
+
+    No SQLite a tabela virtual FTS5 ``core_searchdocument_fts`` usa esta
+    tabela como conteúdo externo e é mantida por triggers (ver a migração
+    ``0002_searchdocument_fts``).
+    """
+
+    doc_type = models.CharField('Tipo', max_length=50)
+    object_id = models.PositiveIntegerField('Objeto')
+    course_id = models.PositiveIntegerField('Curso', null=True, blank=True)
+    title = models.TextField('Título', blank=True)
+    body = models.TextField('Conteúdo', blank=True)
+
+    def __str__(self):
+        return '%s:%s' % (self.doc_type, self.object_id)
+
+    class Meta:
+        verbose_name = 'Documento da Busca'
+        verbose_name_plural = 'Documentos da Busca'
+        unique_together = (('doc_type', 'object_id'),)
@@ -0,0 +1,180 @@
+"""Cache de páginas inteiras para visitantes anônimos.
+
+Só entram as URLs de ``settings.PAGE_CACHE_URL_NAMES``, em GET/HEAD, sem
+usuário logado e sem mensagens do ``django.contrib.messages``. A chave
+leva o caminho e os parâmetros de ``settings.PAGE_CACHE_QUERY_PARAMS``; uma
+URL com qualquer outro parâmetro não usa o cache.
+
+As páginas ficam agrupadas pelo namespace da URL (``courses``, ``forum``,
+``core``) e ``invalidate_pages('forum')`` descarta todo o grupo. O token
+do CSRF dos formulários é trocado a cada entrega, e a view pode deixar em
+``response.page_cache_data`` um dicionário que é repassado ao sinal
+``page_served`` quando a página sai do cache (o fórum conta as
+visualizações dos tópicos assim).
+"""
+import hashlib
+import re
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.urlresolvers import Resolver404, resolve
+from django.dispatch import Signal
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from .cache import bump_version
+from .db import read_from_primary
+
+page_served = Signal(providing_args=['request', 'url_name', 'data'])
+
+CSRF_INPUT_RE = re.compile(
+    br'(name=["\']csrfmiddlewaretoken["\'] value=["\'])[^"\']+')
+CSRF_PLACEHOLDER = b'__page_cache_csrf_token__'
+
+# Cabeçalhos definidos pelas views que vão junto com a página.
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Content-Language')
+
+
+def version_key(group):
+    return 'pages:version:%s' % group
+
+
+def page_key(group, version, path):
+    digest = hashlib.md5(path.encode('utf-8')).hexdigest()
+    return 'pages:%s:%s:%s' % (group, version, digest)
+
+
+def page_version(group):
+    version = cache.get(version_key(group))
+    if version is None:
+        version = bump_version(version_key(group), cache)
+    return version
+
+
+def invalidate_pages(*groups):
+    for group in groups:
+        bump_version(version_key(group), cache)
+
+
+def _url_name(request):
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return None
+    return match.view_name
+
+
+def _has_messages(request):
+    return hasattr(request, '_messages') and len(get_messages(request)) > 0
+
+
+def get_cache_key(request):
+    """Chave da página ou ``None`` se a requisição não pode usar o cache."""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    if request.user.is_authenticated() or _has_messages(request):
+        return None
+    allowed = settings.PAGE_CACHE_QUERY_PARAMS
+    if any(param not in allowed for param in request.GET):
+        return None
+    url_name = _url_name(request)
+    if url_name not in settings.PAGE_CACHE_URL_NAMES:
+        return None
+    query = sorted(
+        (param, value) for param in request.GET
+        for value in request.GET.getlist(param))
+    path = request.path + '?' + '&'.join('%s=%s' % item for item in query)
+    group = url_name.partition(':')[0]
+    return page_key(group, page_version(group), path), url_name
+
+
+def _can_store(request, response):
+    if request.method != 'GET' or response.status_code != 200 or \
+            response.streaming:
+        return False
+    if response.cookies and set(response.cookies) - {
+            settings.CSRF_COOKIE_NAME}:
+        return False
+    cache_control = response.get('Cache-Control', '')
+    if 'private' in cache_control or 'no-store' in cache_control:
+        return False
+    # A view pode ter logado o usuário ou deixado uma mensagem.
+    return not request.user.is_authenticated() and \
+        not _has_messages(request)
+
+
+def freeze(request, response):
+    content = response.content
+    csrf = bool(request.META.get('CSRF_COOKIE_USED'))
+    if csrf:
+        content = CSRF_INPUT_RE.sub(
+            lambda match: match.group(1) + CSRF_PLACEHOLDER, content)
+    headers = {
+        header: response[header] for header in STORED_HEADERS
+        if response.has_header(header)
+    }
+    if csrf:
+        # Os validadores são do token de quem gerou a página; com eles,
+        # outro visitante receberia 304 e ficaria com o próprio token antigo.
+        headers.pop('ETag', None)
+        headers.pop('Last-Modified', None)
+    return {
+        'content': content,
+        'headers': headers,
+        'csrf': csrf,
+        'data': getattr(response, 'page_cache_data', None),
+    }
+
+
+def thaw(request, page):
+    content = page['content']
+    if page['csrf']:
+        content = content.replace(
+            CSRF_PLACEHOLDER, get_token(request).encode('ascii'))
+    response = HttpResponse(content)
+    for header, value in page['headers'].items():
+        response[header] = value
+    return response
+
+
+class AnonymousPageCacheMiddleware(object):
+    """Entrega do cache as páginas públicas para visitantes anônimos.
+
+    Deve vir depois de ``AuthenticationMiddleware`` e
+    ``MessageMiddleware``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        cache_key = get_cache_key(request)
+        if cache_key is None:
+            return self.get_response(request)
+
+        key, url_name = cache_key
+        page = cache.get(key)
+        if page is not None:
+            headers = page['headers']
+            response = get_conditional_response(
+                request, etag=headers.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    headers.get('Last-Modified', '')),
+                response=thaw(request, page))
+            response['X-Page-Cache'] = 'hit'
+            page_served.send(
+                sender=self.__class__, request=request, url_name=url_name,
+                data=page['data'])
+            return response
+
+        # A página vai para o cache de todos: nada de réplica atrasada.
+        with read_from_primary():
+            response = self.get_response(request)
+        if _can_store(request, response):
+            cache.set(key, freeze(request, response),
+                      settings.PAGE_CACHE_TIMEOUT)
+            response['X-Page-Cache'] = 'miss'
+        return response
@@ -0,0 +1,166 @@
+"""Versões reduzidas (renditions) de imagens enviadas pelos usuários.
+
+Cada imagem ganha, ao lado do arquivo original no storage, uma versão por
+tamanho de ``settings.IMAGE_RENDITIONS`` e formato de
+``settings.IMAGE_RENDITION_FORMATS``:
+``courses/images/python.jpg`` -> ``courses/images/python.card.webp``.
+As versões são geradas quando a imagem é gravada (e por
+``manage.py generate_renditions`` para as imagens antigas); enquanto não
+existem, o template usa a imagem original. As URLs ficam no cache.
+"""
+import os
+import tempfile
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+URL_TIMEOUT = 60 * 60 * 24 * 30
+# Versões que ainda não existem: evita um storage.exists por formato em
+# cada requisição; o generate() apaga a marca.
+MISSING_TIMEOUT = 60
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+SAVE_OPTIONS = {
+    'jpeg': {'optimize': True, 'progressive': True},
+    'webp': {'method': 4},
+}
+
+
+def rendition_name(name, size, format):
+    root, ext = os.path.splitext(name)
+    return '%s.%s.%s' % (root, size, EXTENSIONS[format])
+
+
+def url_key(name, size, format):
+    return 'renditions:%s:%s:%s' % (name, size, format)
+
+
+def missing_key(name, size):
+    return 'renditions:missing:%s:%s' % (name, size)
+
+
+def _render(image, dimensions, format):
+    image = image.copy()
+    image.thumbnail(dimensions, Image.LANCZOS)
+    if format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = BytesIO()
+    image.save(output, format.upper(),
+               quality=settings.IMAGE_RENDITION_QUALITY,
+               **SAVE_OPTIONS[format])
+    return output.getvalue()
+
+
+def _write(storage, name, content):
+    """Grava ``content`` exatamente em ``name``, substituindo o arquivo.
+
+    O ``storage.save`` do Django acrescenta um sufixo quando o nome já
+    existe, o que deixaria arquivos órfãos quando dois processos geram a
+    mesma versão ao mesmo tempo.
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        # Storages remotos (S3 etc.) costumam sobrescrever; se este não
+        # sobrescrever, o arquivo com sufixo é descartado.
+        if storage.exists(name):
+            storage.delete(name)
+        saved = storage.save(name, ContentFile(content))
+        if saved != name:
+            storage.delete(saved)
+        return name
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(content)
+        # mkstemp cria o arquivo só para o dono; o servidor web precisa ler.
+        os.chmod(temporary, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return name
+
+
+def generate(name, sizes=None, storage=None, force=True):
+    """Gera as versões de ``name``; retorna os nomes gravados no storage.
+
+    Com ``force=False`` as versões que já existem são mantidas.
+    """
+    storage = storage or default_storage
+    sizes = sizes or list(settings.IMAGE_RENDITIONS)
+    targets = [
+        (size, format, rendition_name(name, size, format))
+        for size in sizes for format in settings.IMAGE_RENDITION_FORMATS
+    ]
+    if not force:
+        targets = [target for target in targets
+                   if not storage.exists(target[2])]
+    if not targets:
+        return []
+
+    with storage.open(name, 'rb') as original:
+        image = Image.open(original)
+        image.load()
+    # Fotos de celular vêm deitadas com a rotação só no EXIF.
+    image = ImageOps.exif_transpose(image)
+
+    saved = []
+    for size, format, target in targets:
+        content = _render(image, settings.IMAGE_RENDITIONS[size], format)
+        saved.append(_write(storage, target, content))
+    cache.delete_many(
+        [url_key(name, size, format) for size, format, target in targets] +
+        [missing_key(name, size) for size in sizes])
+    return saved
+
+
+def get_urls(name, size, storage=None):
+    """``{formato: url}`` das versões de ``name`` em ``size``.
+
+    Retorna ``{}`` se alguma versão ainda não foi gerada, para o template
+    usar a imagem original; nada é redimensionado durante a requisição.
+    """
+    storage = storage or default_storage
+    formats = settings.IMAGE_RENDITION_FORMATS
+    keys = {url_key(name, size, format): format for format in formats}
+    cached = cache.get_many(list(keys) + [missing_key(name, size)])
+    if missing_key(name, size) in cached:
+        return {}
+    if len(cached) == len(keys):
+        return {keys[key]: url for key, url in cached.items()}
+
+    if not all(storage.exists(rendition_name(name, size, format))
+               for format in formats):
+        cache.set(missing_key(name, size), True, MISSING_TIMEOUT)
+        return {}
+    urls = {
+        format: storage.url(rendition_name(name, size, format))
+        for format in formats
+    }
+    cache.set_many(
+        {url_key(name, size, format): url for format, url in urls.items()},
+        URL_TIMEOUT)
+    return urls
+
+
+def delete(name, storage=None):
+    storage = storage or default_storage
+    keys = []
+    for size in settings.IMAGE_RENDITIONS:
+        for format in settings.IMAGE_RENDITION_FORMATS:
+            target = rendition_name(name, size, format)
+            if storage.exists(target):
+                storage.delete(target)
+            keys.append(url_key(name, size, format))
+    cache.delete_many(keys)
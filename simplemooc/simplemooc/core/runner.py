@@ -0,0 +1,26 @@
+import copy
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Roda os testes com os caches em arquivo numa pasta temporária."""
+
+    def setup_test_environment(self, **kwargs):
+        super(TestRunner, self).setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix='simplemooc_cache_')
+        caches = copy.deepcopy(settings.CACHES)
+        for config in caches.values():
+            if config['BACKEND'].endswith('FileBasedCache'):
+                config['LOCATION'] = self.cache_dir
+        self.cache_override = override_settings(CACHES=caches)
+        self.cache_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super(TestRunner, self).teardown_test_environment(**kwargs)
@@ -0,0 +1,182 @@
+"""Busca textual do simplemooc.
+
+Os modelos são registrados com ``register`` (como no admin) e mantidos no
+índice pelos sinais ``post_save``/``post_delete``. O backend é definido em
+``settings.SEARCH_BACKEND``; se o FTS5 do SQLite não estiver disponível, é
+usado o índice invertido em ``settings.SEARCH_INDEX_PATH``.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.db.models import signals
+from django.utils.module_loading import import_string
+
+from .backends import Document, InvertedIndexBackend, SQLiteFTSBackend
+from .text import normalize
+
+_registry = {}
+_backend = None
+
+Result = namedtuple('Result', 'object verbose_name url score')
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(settings.SEARCH_BACKEND)
+        if backend_class is SQLiteFTSBackend and \
+                not SQLiteFTSBackend.is_available():
+            backend_class = InvertedIndexBackend
+        if backend_class is InvertedIndexBackend:
+            _backend = InvertedIndexBackend(settings.SEARCH_INDEX_PATH)
+        else:
+            _backend = backend_class()
+    return _backend
+
+
+def doc_type_for(model):
+    return model._meta.label_lower
+
+
+class ModelIndex(object):
+
+    def __init__(self, model, title=None, body=(), course=None, related=()):
+        self.model = model
+        self.doc_type = doc_type_for(model)
+        self.title = title
+        self.body = body
+        self.course = course
+        self.related = related
+
+    def document(self, instance):
+        title = getattr(instance, self.title) if self.title else ''
+        body = ' '.join(
+            getattr(instance, field) or '' for field in self.body)
+        course_id = getattr(instance, self.course) if self.course else None
+        return Document(
+            self.doc_type, instance.pk, normalize(title), normalize(body),
+            course_id
+        )
+
+    def get_queryset(self):
+        queryset = self.model._default_manager.order_by()
+        if self.related:
+            queryset = queryset.select_related(*self.related)
+        return queryset
+
+
+def register(model, title=None, body=(), course=None, related=()):
+    """Indexa ``model`` pelos campos ``title`` e ``body``.
+
+    ``course`` é o atributo com o id do curso do objeto; documentos sem
+    curso são públicos. ``related`` é repassado ao ``select_related`` ao
+    carregar os objetos encontrados.
+    """
+    model_index = ModelIndex(model, title, body, course, related)
+    _registry[model] = model_index
+    uid = 'search_%s' % model_index.doc_type
+    signals.post_save.connect(
+        _post_save, sender=model, dispatch_uid=uid + '_save')
+    signals.post_delete.connect(
+        _post_delete, sender=model, dispatch_uid=uid + '_delete')
+    return model_index
+
+
+def registered_models():
+    return list(_registry)
+
+
+def _post_save(sender, instance, **kwargs):
+    get_backend().index([_registry[sender].document(instance)])
+
+
+def _post_delete(sender, instance, **kwargs):
+    get_backend().remove(_registry[sender].doc_type, [instance.pk])
+
+
+def search_queryset(queryset, query):
+    """``queryset`` filtrado por ``query`` e ordenado pela relevância."""
+    return get_backend().filter_queryset(
+        queryset, query, doc_type_for(queryset.model))
+
+
+class SearchResults(object):
+    """Resultados de ``query`` em todos os modelos registrados.
+
+    Pode ser passado ao ``Paginator``: o total e cada página são uma
+    consulta ao backend, e só os objetos da página são carregados, com uma
+    consulta por tipo de documento.
+    """
+
+    def __init__(self, query, course_ids=None, doc_types=None,
+                 object_ids=None):
+        self.query = query
+        self.course_ids = course_ids
+        self.doc_types = doc_types
+        self.object_ids = object_ids
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = get_backend().count(
+                self.query, self.doc_types, self.course_ids,
+                object_ids=self.object_ids)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('SearchResults só aceita fatias simples.')
+        start = index.start or 0
+        limit = None if index.stop is None else max(index.stop - start, 0)
+        hits = get_backend().search(
+            self.query, self.doc_types, self.course_ids, limit=limit,
+            offset=start, object_ids=self.object_ids)
+        return resolve(hits)
+
+
+def resolve(hits):
+    """Converte ``Hit`` em ``Result``, descartando objetos já removidos."""
+    indexes = {index.doc_type: index for index in _registry.values()}
+    object_ids = {}
+    for hit in hits:
+        object_ids.setdefault(hit.doc_type, []).append(hit.object_id)
+    objects = {
+        doc_type: indexes[doc_type].get_queryset().in_bulk(ids)
+        for doc_type, ids in object_ids.items() if doc_type in indexes
+    }
+    results = []
+    for hit in hits:
+        obj = objects.get(hit.doc_type, {}).get(hit.object_id)
+        if obj is not None:
+            results.append(Result(
+                obj, obj._meta.verbose_name, obj.get_absolute_url(),
+                hit.score))
+    return results
+
+
+def rebuild(model, chunk_size=1000, queryset=None):
+    """Reindexa todos os objetos de ``model`` lendo o banco em lotes.
+
+    ``queryset`` substitui o do modelo registrado; as migrações passam o
+    do modelo histórico.
+    """
+    model_index = _registry[model]
+    backend = get_backend()
+    backend.clear(model_index.doc_type)
+    if queryset is None:
+        queryset = model_index.get_queryset()
+    chunk = []
+    total = 0
+    for instance in queryset.iterator():
+        chunk.append(model_index.document(instance))
+        if len(chunk) >= chunk_size:
+            backend.index(chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        backend.index(chunk)
+        total += len(chunk)
+    return total
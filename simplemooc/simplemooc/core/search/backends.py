@@ -0,0 +1,347 @@
+import math
+import os
+import pickle
+import threading
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+
+from django.core.files import locks
+from django.db import connection
+from django.db.models import Case, IntegerField, When
+
+from simplemooc.core.models import SearchDocument
+
+from .text import tokenize
+
+Document = namedtuple('Document', 'doc_type object_id title body course_id')
+Hit = namedtuple('Hit', 'doc_type object_id score')
+
+# Peso dos termos do título em relação aos do conteúdo.
+TITLE_WEIGHT = 10.0
+
+
+class BaseSearchBackend(object):
+
+    def index(self, documents):
+        raise NotImplementedError
+
+    def remove(self, doc_type, object_ids):
+        raise NotImplementedError
+
+    def clear(self, doc_type):
+        raise NotImplementedError
+
+    def search(self, query, doc_types=None, course_ids=None, limit=None,
+               offset=0, object_ids=None):
+        """Lista de ``Hit`` ordenada da maior para a menor relevância.
+
+        Com ``course_ids`` só entram os documentos sem curso e os dos
+        cursos informados; ``None`` não restringe nada. ``object_ids``
+        (``{doc_type: ids}``) limita os documentos desses tipos aos ids
+        informados.
+        """
+        raise NotImplementedError
+
+    def count(self, query, doc_types=None, course_ids=None, object_ids=None):
+        return len(self.search(query, doc_types, course_ids,
+                               object_ids=object_ids))
+
+    def filter_queryset(self, queryset, query, doc_type):
+        hits = self.search(query, doc_types=[doc_type])
+        pks = [hit.object_id for hit in hits]
+        if not pks:
+            return queryset.none()
+        ranking = Case(
+            *[When(pk=pk, then=position) for position, pk in enumerate(pks)],
+            output_field=IntegerField()
+        )
+        return queryset.filter(pk__in=pks).order_by(ranking)
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """Busca na tabela FTS5 criada pela migração ``core.0002``.
+
+    Os documentos ficam no mesmo banco que os dados, então a indexação
+    participa da mesma transação que o ``save()`` que a disparou.
+    """
+
+    table = 'core_searchdocument_fts'
+
+    @classmethod
+    def is_available(cls):
+        if connection.vendor != 'sqlite':
+            return False
+        return cls.table in connection.introspection.table_names()
+
+    def index(self, documents):
+        documents = list(documents)
+        keys = defaultdict(list)
+        for document in documents:
+            keys[document.doc_type].append(document.object_id)
+        for doc_type, object_ids in keys.items():
+            self.remove(doc_type, object_ids)
+        SearchDocument.objects.bulk_create([
+            SearchDocument(
+                doc_type=document.doc_type, object_id=document.object_id,
+                course_id=document.course_id, title=document.title,
+                body=document.body
+            ) for document in documents
+        ])
+
+    def remove(self, doc_type, object_ids):
+        SearchDocument.objects.filter(
+            doc_type=doc_type, object_id__in=list(object_ids)).delete()
+
+    def clear(self, doc_type):
+        SearchDocument.objects.filter(doc_type=doc_type).delete()
+
+    def match_expression(self, query):
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        return ' '.join('"%s"*' % token for token in tokens)
+
+    def _where(self, match, doc_types, course_ids, object_ids):
+        sql = [' WHERE {table} MATCH %s']
+        params = [match]
+        if doc_types:
+            # "+" pelo mesmo motivo de filter_queryset: o MATCH vem primeiro.
+            sql.append(' AND +d.doc_type IN (%s)' % ', '.join(
+                ['%s'] * len(doc_types)))
+            params.extend(doc_types)
+        if course_ids is not None:
+            course_ids = list(course_ids)
+            if course_ids:
+                sql.append(' AND (d.course_id IS NULL OR d.course_id IN (%s))'
+                           % ', '.join(['%s'] * len(course_ids)))
+                params.extend(course_ids)
+            else:
+                sql.append(' AND d.course_id IS NULL')
+        for doc_type, ids in (object_ids or {}).items():
+            ids = list(ids)
+            if ids:
+                sql.append(' AND (d.doc_type != %%s OR d.object_id IN (%s))'
+                           % ', '.join(['%s'] * len(ids)))
+                params.extend([doc_type] + ids)
+            else:
+                sql.append(' AND d.doc_type != %s')
+                params.append(doc_type)
+        return sql, params
+
+    def search(self, query, doc_types=None, course_ids=None, limit=None,
+               offset=0, object_ids=None):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+
+        where, params = self._where(match, doc_types, course_ids, object_ids)
+        sql = [
+            'SELECT d.doc_type, d.object_id,',
+            ' bm25({table}, {weight}, 1.0) AS rank',
+            ' FROM {table} JOIN core_searchdocument d',
+            ' ON d.id = {table}.rowid',
+        ] + where
+        sql.append(' ORDER BY rank LIMIT %s OFFSET %s')
+        params.extend([-1 if limit is None else limit, offset])
+
+        with connection.cursor() as cursor:
+            cursor.execute(''.join(sql).format(
+                table=self.table, weight=TITLE_WEIGHT), params)
+            return [Hit(doc_type, object_id, -rank)
+                    for doc_type, object_id, rank in cursor.fetchall()]
+
+    def count(self, query, doc_types=None, course_ids=None, object_ids=None):
+        match = self.match_expression(query)
+        if match is None:
+            return 0
+
+        where, params = self._where(match, doc_types, course_ids, object_ids)
+        sql = [
+            'SELECT COUNT(*) FROM {table} JOIN core_searchdocument d',
+            ' ON d.id = {table}.rowid',
+        ] + where
+        with connection.cursor() as cursor:
+            cursor.execute(''.join(sql).format(table=self.table), params)
+            return cursor.fetchone()[0]
+
+    def filter_queryset(self, queryset, query, doc_type):
+        # Uma única consulta: junta a tabela FTS à do modelo e ordena pelo
+        # bm25, sem trazer a lista de ids para o Python. O "+" no doc_type
+        # impede o SQLite de usar o índice (doc_type, object_id) e o obriga
+        # a começar pelo MATCH; sem ele o COUNT(*) varre todos os documentos.
+        match = self.match_expression(query)
+        if match is None:
+            return queryset.none()
+        model_table = queryset.model._meta.db_table
+        return queryset.extra(
+            select={'search_rank': 'bm25({0}, {1}, 1.0)'.format(
+                self.table, TITLE_WEIGHT)},
+            tables=['core_searchdocument', self.table],
+            where=[
+                '+core_searchdocument.doc_type = %s',
+                'core_searchdocument.object_id = {0}.id'.format(model_table),
+                '{0}.rowid = core_searchdocument.id'.format(self.table),
+                '{0} MATCH %s'.format(self.table),
+            ],
+            params=[doc_type, match],
+            order_by=['search_rank'],
+        )
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """Índice invertido em Python gravado com pickle em ``path``.
+
+    Usado quando o banco não é SQLite com FTS5. O arquivo é relido quando
+    outro processo o altera. Cada alteração relê e regrava o arquivo inteiro
+    sob um lock em ``path + '.lock'``, o que só serve para índices pequenos
+    (desenvolvimento, testes, poucos cursos).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._postings = defaultdict(dict)
+        self._documents = {}
+        self._vocabulary = None
+
+    def _stat(self):
+        # O os.replace troca o inode: duas gravações no mesmo instante do
+        # relógio do sistema de arquivos ainda dão assinaturas diferentes.
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        try:
+            signature = self._stat()
+        except OSError:
+            return
+        if signature == self._signature:
+            return
+        with open(self.path, 'rb') as index_file:
+            postings, documents = pickle.load(index_file)
+        self._postings = defaultdict(dict, postings)
+        self._documents = documents
+        self._vocabulary = None
+        self._signature = signature
+
+    def _save(self):
+        tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp_path, 'wb') as index_file:
+            pickle.dump((dict(self._postings), self._documents), index_file,
+                        pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+        self._signature = self._stat()
+
+    @contextmanager
+    def _update(self):
+        """Lê, altera e grava o índice sem perder a alteração de outro
+        processo feita no meio do caminho."""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.path + '.lock', 'wb') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                self._load()
+                yield
+                self._vocabulary = None
+                self._save()
+            finally:
+                locks.unlock(lock_file)
+
+    def _discard(self, key):
+        document = self._documents.pop(key, None)
+        if document is None:
+            return
+        for token in document['tokens']:
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[token]
+
+    def index(self, documents):
+        with self._update():
+            for document in documents:
+                key = (document.doc_type, document.object_id)
+                self._discard(key)
+                weights = defaultdict(float)
+                for token in document.title.split():
+                    weights[token] += TITLE_WEIGHT
+                body = document.body.split()
+                for token in body:
+                    weights[token] += 1.0
+                for token, weight in weights.items():
+                    self._postings[token][key] = weight
+                self._documents[key] = {
+                    'tokens': list(weights),
+                    'length': len(body) + len(document.title.split()),
+                    'course_id': document.course_id,
+                }
+
+    def remove(self, doc_type, object_ids):
+        with self._update():
+            for object_id in object_ids:
+                self._discard((doc_type, object_id))
+
+    def clear(self, doc_type):
+        with self._update():
+            for key in [key for key in self._documents if key[0] == doc_type]:
+                self._discard(key)
+
+    def _expand(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and \
+                self._vocabulary[position].startswith(prefix):
+            yield self._vocabulary[position]
+            position += 1
+
+    def search(self, query, doc_types=None, course_ids=None, limit=None,
+               offset=0, object_ids=None):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            self._load()
+            total = len(self._documents) or 1
+            scores = None
+            for token in tokens:
+                # Como no FTS5, cada termo da consulta é um prefixo e todos
+                # precisam aparecer no documento.
+                token_scores = defaultdict(float)
+                for term in self._expand(token):
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for key, weight in postings.items():
+                        length = self._documents[key]['length'] or 1
+                        token_scores[key] += idf * weight / math.sqrt(length)
+                if scores is None:
+                    scores = token_scores
+                else:
+                    scores = {key: score + token_scores[key]
+                              for key, score in scores.items()
+                              if key in token_scores}
+                if not scores:
+                    return []
+
+            if course_ids is not None:
+                course_ids = set(course_ids)
+                scores = {
+                    key: score for key, score in scores.items()
+                    if self._documents[key]['course_id'] in course_ids or
+                    self._documents[key]['course_id'] is None
+                }
+
+        object_ids = {doc_type: set(ids)
+                      for doc_type, ids in (object_ids or {}).items()}
+        hits = [Hit(key[0], key[1], score) for key, score in scores.items()
+                if (not doc_types or key[0] in doc_types) and
+                (key[0] not in object_ids or key[1] in object_ids[key[0]])]
+        hits.sort(key=lambda hit: (-hit.score, hit.object_id))
+        end = None if limit is None else offset + limit
+        return hits[offset:end]
@@ -0,0 +1,53 @@
+"""Análise de texto em português usada na indexação e nas consultas."""
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre era essa esse esta este
+eu foi ha isso isto ja la mais mas me mesmo meu minha muito na nas nem no
+nos num numa o os ou para pela pelas pelo pelos por qual quando que quem
+se sem ser seu sua sao so tambem te tem um uma umas uns voce
+""".split())
+
+# Redução de plural (passo de plural do RSLP, simplificado), aplicada
+# depois da remoção dos acentos.
+PLURAL_SUFFIXES = (
+    ('oes', 'ao'),
+    ('aes', 'ao'),
+    ('ais', 'al'),
+    ('eis', 'el'),
+    ('res', 'r'),
+    ('ses', 's'),
+    ('zes', 'z'),
+    ('ns', 'm'),
+)
+
+
+def fold(text):
+    """Minúsculas e sem acentos: ``'Programação'`` vira ``'programacao'``."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+
+def stem(token):
+    if len(token) <= 3:
+        return token
+    for suffix, replacement in PLURAL_SUFFIXES:
+        if token.endswith(suffix):
+            return token[:-len(suffix)] + replacement
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [
+        stem(token) for token in TOKEN_RE.findall(fold(text or ''))
+        if token not in STOPWORDS
+    ]
+
+
+def normalize(text):
+    return ' '.join(tokenize(text))
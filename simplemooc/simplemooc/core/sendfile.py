@@ -0,0 +1,140 @@
+"""Entrega de arquivos protegidos depois da checagem de permissão na view.
+
+Com ``settings.SENDFILE_BACKEND`` igual a ``'xsendfile'`` (Apache/lighttpd)
+ou ``'nginx'`` a resposta sai vazia, só com o cabeçalho que manda o servidor
+web enviar o arquivo. Sem backend o próprio Django faz o streaming, com
+suporte a Range e GET condicional.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import force_str
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Um .tar.gz guardado é o próprio arquivo compactado, não um .tar com
+# Content-Encoding: o navegador descompactaria e salvaria outra coisa.
+ENCODING_TYPES = {
+    'gzip': 'application/gzip',
+    'bzip2': 'application/x-bzip2',
+    'xz': 'application/x-xz',
+}
+
+
+class FileRange(object):
+    """Arquivo limitado a ``length`` bytes a partir de ``start``."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """``(início, fim)`` do cabeçalho Range, ``None`` se não houver um
+    intervalo único válido ou ``False`` se ele estiver fora do arquivo."""
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N: os últimos N bytes.
+        length = int(end)
+        if not length:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def sendfile(request, path, filename=None, attachment=False):
+    stat = os.stat(path)
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag('%x-%x' % (last_modified, stat.st_size))
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding:
+        content_type = ENCODING_TYPES.get(encoding)
+    content_type = content_type or 'application/octet-stream'
+    backend = settings.SENDFILE_BACKEND
+
+    if backend == 'xsendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = force_str(path)
+    elif backend == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        relative = os.path.relpath(path, settings.SENDFILE_ROOT)
+        response['X-Accel-Redirect'] = force_str(
+            settings.SENDFILE_URL.rstrip('/') + '/' +
+            relative.replace(os.sep, '/'))
+    else:
+        response = _stream(request, path, stat.st_size, etag, last_modified,
+                           content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if filename:
+        response['Content-Disposition'] = '%s; filename="%s"' % (
+            'attachment' if attachment else 'inline',
+            filename.replace('"', ''))
+    return response
+
+
+def _stream(request, path, size, etag, last_modified, content_type):
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and \
+            _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            FileRange(file, start, end - start + 1),
+            content_type=content_type, status=206)
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    return response
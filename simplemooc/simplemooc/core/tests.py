@@ -1,9 +1,60 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from importlib import import_module
+from smtplib import SMTPException
+
+from django.apps import apps
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.sessions.models import Session
 from django.core import mail
-from django.test import TestCase
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
 from django.test.client import Client
 from django.core.urlresolvers import reverse
+from django.utils import timezone
+from model_mommy import mommy
+
+from simplemooc.accounts.models import User
+from simplemooc.core import db, metrics, search
+from simplemooc.core.cache import TieredCache
+from simplemooc.core.pagecache import (
+    CSRF_PLACEHOLDER, invalidate_pages, page_version)
+from simplemooc.core.mail import send_mass_mail_template
+from simplemooc.core.search.backends import Document, InvertedIndexBackend
+from simplemooc.core.search.text import normalize
+from simplemooc.courses.cache import load_course
+from simplemooc.courses.decorators import resolve_course_access
+from simplemooc.courses.models import Course
+from simplemooc.courses.templatetags.courses_tags import load_my_courses
+from simplemooc.forum.counters import thread_views
+
+
+class RejectingBackend(locmem.EmailBackend):
+    """Recusa qualquer envio que contenha o endereço ``rejected``."""
+
+    def __init__(self, rejected, **kwargs):
+        super(RejectingBackend, self).__init__(**kwargs)
+        self.rejected = rejected
+        self.calls = []
+
+    def send_messages(self, messages):
+        self.calls.append(len(messages))
+        if any(self.rejected in message.to for message in messages):
+            raise SMTPException('destinatário recusado')
+        return super(RejectingBackend, self).send_messages(messages)
+
 
 class HomeViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_home_status_code(self):
         client = Client()
         response = client.get(reverse('core:home'))
@@ -13,4 +64,399 @@ class HomeViewTest(TestCase):
         client = Client()
         response = client.get(reverse('core:home'))
         self.assertTemplateUsed(response, 'home.html')
-        self.assertTemplateUsed(response, 'base.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'base.html')
+
+class SendMassMailTemplateTest(TestCase):
+    def test_results_per_recipient(self):
+        context = {'announcement': {'content': 'Oi'}}
+        results = send_mass_mail_template(
+            'Assunto', 'courses/announcement_mail.html',
+            [(context, ['a@a.com']), (context, ['b@b.com'])], batch_size=1
+        )
+        self.assertEqual(results, [(['a@a.com'], True), (['b@b.com'], True)])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn('Oi', mail.outbox[1].body)
+
+    def test_failure_does_not_resend_to_others(self):
+        context = {'announcement': {'content': 'Oi'}}
+        connection = RejectingBackend(rejected='c@c.com')
+        results = send_mass_mail_template(
+            'Assunto', 'courses/announcement_mail.html',
+            [(context, [email]) for email in
+             ('a@a.com', 'b@b.com', 'c@c.com', 'd@d.com')],
+            batch_size=2, fail_silently=True, connection=connection
+        )
+        self.assertEqual([sent for _, sent in results],
+                         [True, True, False, True])
+        self.assertEqual(connection.calls, [1, 1, 1, 1])
+        self.assertEqual([message.to for message in mail.outbox],
+                         [['a@a.com'], ['b@b.com'], ['d@d.com']])
+
+    def test_failure_raised_unless_fail_silently(self):
+        context = {'announcement': {'content': 'Oi'}}
+        connection = RejectingBackend(rejected='b@b.com')
+        with self.assertRaises(SMTPException):
+            send_mass_mail_template(
+                'Assunto', 'courses/announcement_mail.html',
+                [(context, ['a@a.com']), (context, ['b@b.com'])],
+                connection=connection
+            )
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class InvertedIndexBackendTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'index.pickle')
+        self.backend = InvertedIndexBackend(self.path)
+        self.backend.index([
+            Document('courses.course', 1, normalize('Python para Devs'),
+                     normalize('Aulas de programação'), None),
+            Document('courses.course', 2, normalize('Django'),
+                     normalize('Python na web'), None),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_ranked_prefix_search(self):
+        hits = self.backend.search('pyth')
+        self.assertEqual([hit.object_id for hit in hits], [1, 2])
+        self.assertEqual(
+            [hit.object_id for hit in self.backend.search('programacoes')],
+            [1])
+
+    def test_object_ids_restrict_a_doc_type(self):
+        hits = self.backend.search(
+            'python', object_ids={'courses.course': [2]})
+        self.assertEqual([hit.object_id for hit in hits], [2])
+
+    def test_index_persisted_to_disk(self):
+        self.backend.remove('courses.course', [1])
+        reloaded = InvertedIndexBackend(self.path)
+        self.assertEqual(
+            [hit.object_id for hit in reloaded.search('python')], [2])
+
+
+    def test_writers_do_not_lose_updates(self):
+        # Duas instâncias no mesmo arquivo, como dois processos.
+        other = InvertedIndexBackend(self.path)
+        self.backend.search('python')
+        other.index([Document('courses.course', 3, normalize('Flask'), '',
+                              None)])
+        self.backend.index([Document('courses.course', 4, normalize('Flask'),
+                                     '', None)])
+        self.assertEqual(
+            sorted(hit.object_id for hit in other.search('flask')), [3, 4])
+
+class SearchBackfillMigrationTest(TestCase):
+    def test_existing_rows_indexed(self):
+        course = mommy.make('courses.Course', name='Python para Devs')
+        for model in search.registered_models():
+            search.get_backend().clear(search.doc_type_for(model))
+        self.assertFalse(Course.objects.search('python').exists())
+
+        migration = import_module(
+            'simplemooc.core.migrations.0003_backfill_search_index')
+        with connection.schema_editor() as schema_editor:
+            migration.backfill_index(apps, schema_editor)
+        self.assertEqual(list(Course.objects.search('python')), [course])
+        # A cópia da análise de texto na migração segue a atual.
+        text = 'Programações em Python, não só Listas'
+        self.assertEqual(migration.normalize(text), normalize(text))
+
+
+class SearchViewTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = mommy.make('courses.Course', name='Django', slug='django')
+        self.lesson = mommy.make(
+            'courses.Lesson', course=self.course, name='Models',
+            description='Consultas com querysets',
+            release_date=timezone.now().date())
+        self.thread = mommy.make(
+            'forum.Thread', title='Dúvida', body='Como usar querysets?')
+        mommy.make('forum.Reply', thread=self.thread, reply='Leia as consultas')
+        self.user = mommy.make('accounts.User')
+        self.user.set_password('123')
+        self.user.save()
+
+    def found(self, response):
+        return [result.object for result in response.context['page_obj']]
+
+    def test_lessons_need_approved_enrollment(self):
+        url = reverse('core:search')
+        response = self.client.get(url, {'q': 'querysets'})
+        self.assertEqual(self.found(response), [self.thread])
+
+        mommy.make('courses.Enrollment', user=self.user, course=self.course,
+                   status=1)
+        self.client.login(username=self.user.username, password='123')
+        response = self.client.get(url, {'q': 'querysets'})
+        self.assertEqual(set(self.found(response)), {self.thread, self.lesson})
+
+    def test_unreleased_lessons_only_for_staff(self):
+        mommy.make('courses.Enrollment', user=self.user, course=self.course,
+                   status=1)
+        self.client.login(username=self.user.username, password='123')
+        self.lesson.release_date = None
+        self.lesson.save()
+        url = reverse('core:search')
+        response = self.client.get(url, {'q': 'querysets'})
+        self.assertEqual(self.found(response), [self.thread])
+        self.assertEqual(response.context['paginator'].count, 1)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, {'q': 'querysets'})
+        self.assertEqual(set(self.found(response)), {self.thread, self.lesson})
+
+    def test_index_follows_deletes(self):
+        self.lesson.delete()
+        self.user.is_staff = True
+        self.user.save()
+        self.client.login(username=self.user.username, password='123')
+        response = self.client.get(reverse('core:search'), {'q': 'consultas'})
+        self.assertEqual(response.context['paginator'].count, 1)
+        self.assertEqual(self.found(response)[0].thread, self.thread)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        connections.databases['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'replica.sqlite3'}
+        self.router = db.ReplicaRouter()
+        db.unpin_primary()
+
+    def tearDown(self):
+        if hasattr(connections._connections, 'replica'):
+            connections['replica'].close()
+            del connections._connections.replica
+        del connections.databases['replica']
+        db.unpin_primary()
+
+    def test_reads_go_to_replica_until_a_write(self):
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+        self.assertEqual(self.router.db_for_read(Session), 'default')
+        self.assertEqual(self.router.db_for_write(Course), 'default')
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+
+    def test_sticky_cookie_after_write(self):
+        def view(request):
+            reads = self.router.db_for_read(Course)
+            if request.method == 'POST':
+                self.router.db_for_write(Course)
+            return HttpResponse(reads)
+
+        middleware = db.PrimaryPinMiddleware(view)
+        response = middleware(RequestFactory().post('/'))
+        self.assertEqual(response.content, b'replica')
+        self.assertIn(db.STICKY_COOKIE, response.cookies)
+
+        request = RequestFactory().get('/')
+        request.COOKIES[db.STICKY_COOKIE] = '1'
+        self.assertEqual(middleware(request).content, b'default')
+        self.assertEqual(
+            middleware(RequestFactory().get('/')).content, b'replica')
+
+    def test_cache_filled_from_primary_after_write(self):
+        # A réplica está vazia, como uma réplica atrasada: uma leitura
+        # nela falharia ou traria a situação antiga.
+        connections.databases['replica']['NAME'] = ':memory:'
+        cache.clear()
+        course = mommy.make('courses.Course', slug='django')
+        student = mommy.make('accounts.User')
+        enrollment = mommy.make(
+            'courses.Enrollment', user=student, course=course, status=0)
+        db.unpin_primary()
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+
+        # O administrador aprova; outra requisição, sem o cookie de quem
+        # escreveu, preenche o cache.
+        enrollment.status = 1
+        enrollment.save()
+        db.unpin_primary()
+        self.assertEqual(resolve_course_access(student, 'django')[1], 1)
+        self.assertEqual(
+            [summary.status for summary in load_my_courses(student)], [1])
+        self.assertEqual(
+            load_course('django', lambda: Course.objects.get(slug='django')),
+            course)
+        self.assertFalse(db.is_pinned())
+
+    def test_background_writes_do_not_pin(self):
+        user = mommy.make('accounts.User')
+        db.unpin_primary()
+        user_logged_in.send(sender=User, request=None, user=user)
+        self.assertFalse(db.is_pinned())
+        user.refresh_from_db()
+        self.assertIsNotNone(user.last_login)
+        self.assertEqual(self.router.db_for_write(Session), 'default')
+        thread = mommy.make('forum.Thread')
+        db.unpin_primary()
+        thread_views.hit(thread.pk)
+        thread_views.flush()
+        self.assertFalse(db.is_pinned())
+        self.assertEqual(self.router.db_for_read(Course), 'replica')
+
+
+class TieredCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = TieredCache('shared', {
+            'KEY_PREFIX': 'tiered_test', 'OPTIONS': {'L1_MAX_ENTRIES': 2}})
+        self.cache.reset_stats()
+
+    def test_l1_in_front_of_shared_cache(self):
+        self.cache.set('courses:a', [1])
+        self.cache.get('courses:a').append(2)
+        self.assertEqual(self.cache.get('courses:a'), [1])
+        self.cache.set('courses:b', 2)
+        self.cache.set('courses:c', 3)
+        # "a" saiu da L1 (LRU) e volta do cache compartilhado.
+        self.assertEqual(self.cache.get('courses:a'), [1])
+        stats = self.cache.stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits']), (2, 1))
+
+        self.cache.invalidate_namespace('courses')
+        self.assertIsNone(self.cache.get('courses:b'))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_invalidations_in_the_same_millisecond(self):
+        for value in range(200):
+            self.cache.set('courses:a', value)
+            self.cache.invalidate_namespace('courses')
+            self.assertIsNone(self.cache.get('courses:a'))
+
+    def test_single_flight_serves_stale_value(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.cache.get_or_compute('courses:x', compute), 1)
+        self.assertEqual(self.cache.get_or_compute('courses:x', compute), 1)
+        self.assertEqual(len(calls), 1)
+
+        # Perto de expirar, com outro processo já recalculando.
+        self.cache.set('courses:x', (1, 1000.0, time.time() + 1))
+        self.cache.l2.add(self.cache._key('courses:x:lock'), 1)
+        self.assertEqual(self.cache.get_or_compute('courses:x', compute), 1)
+        self.assertEqual(self.cache.stats()['stale_hits'], 1)
+
+        self.cache.l2.delete(self.cache._key('courses:x:lock'))
+        self.assertEqual(self.cache.get_or_compute('courses:x', compute), 2)
+        self.assertEqual(self.cache.stats()['early_recomputes'], 1)
+
+
+    def test_state_shared_between_threads(self):
+        self.cache.set('courses:a', 1)
+
+        def other_thread():
+            # O Django cria uma instância do backend por thread.
+            other = TieredCache('shared', {
+                'KEY_PREFIX': 'tiered_test',
+                'OPTIONS': {'L1_MAX_ENTRIES': 2}})
+            results.append(other.get('courses:a'))
+            other.delete('courses:a')
+
+        results = []
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        self.assertEqual(results, [1])
+        self.assertEqual(self.cache.stats()['l1_hits'], 1)
+        self.assertEqual(self.cache.stats()['deletes'], 1)
+        # A remoção na outra thread também tirou o valor desta L1.
+        self.assertIsNone(self.cache.get('courses:a'))
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.thread = mommy.make('forum.Thread', slug='duvida')
+        self.url = self.thread.get_absolute_url()
+
+    def tearDown(self):
+        thread_views.flush()
+
+    def test_anonymous_pages_cached_until_reply(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'miss')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertNotIn(CSRF_PLACEHOLDER, response.content)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertEqual(thread_views.pending(self.thread.pk), 2)
+
+        self.assertNotIn(
+            'X-Page-Cache', self.client.get(self.url, {'utm': 'x'}))
+        mommy.make('forum.Reply', thread=self.thread, reply='Resposta nova')
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Resposta nova')
+
+    def test_every_invalidation_changes_the_version(self):
+        versions = {page_version('forum')}
+        for _ in range(100):
+            invalidate_pages('forum')
+            versions.add(page_version('forum'))
+        self.assertEqual(len(versions), 101)
+
+    def test_cached_form_gets_a_valid_csrf_token(self):
+        course = mommy.make('courses.Course', slug='django')
+        url = reverse('courses:details', args=[course.slug])
+        Client().get(url)
+        client = Client(enforce_csrf_checks=True)
+        response = client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        token = re.search(
+            r'name=.csrfmiddlewaretoken. value=.(\w+)',
+            response.content.decode()).group(1)
+        response = client.post(url, {
+            'csrfmiddlewaretoken': token, 'name': 'Ana',
+            'email': 'ana@simplemooc.org', 'message': 'Dúvida'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_logged_in_users_not_cached(self):
+        user = mommy.make('accounts.User')
+        user.set_password('123')
+        user.save()
+        self.client.login(username=user.username, password='123')
+        self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', self.client.get(self.url))
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.thread = mommy.make('forum.Thread', slug='duvida')
+
+    def tearDown(self):
+        thread_views.flush()
+
+    def test_server_timing_and_stats_per_view(self):
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0, DEBUG=True), \
+                self.assertLogs('simplemooc.slow_queries') as logs:
+            response = self.client.get(self.thread.get_absolute_url())
+        self.assertRegex(
+            response['Server-Timing'],
+            r'db;dur=[\d.]+;desc="[1-9]\d* consultas", tpl;dur=[\d.]*[1-9]')
+        self.assertIn('forum:thread', logs.output[0])
+
+        response = self.client.get(self.thread.get_absolute_url())
+        self.assertFalse(response.has_header('Server-Timing'))
+        stats = metrics.stats()['forum:thread']
+        self.assertEqual(stats['requests'], 2)
+        self.assertGreater(stats['cache_hits'], 0)
+        self.assertGreater(stats['template_ms_per_request'], 0)
+
+        user = mommy.make('accounts.User', is_staff=True)
+        self.client.force_login(user)
+        response = self.client.get(self.thread.get_absolute_url())
+        self.assertTrue(response.has_header('Server-Timing'))
+        response = self.client.get(reverse('core:request_metrics'))
+        self.assertIn('forum:thread', response.json()['views'])
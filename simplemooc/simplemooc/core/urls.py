@@ -5,4 +5,7 @@ from . import views
 urlpatterns = [
     url(r'^$', views.home, name='home'),
     url(r'^contato/$', views.contact, name='contact'),
+    url(r'^busca/$', views.search, name='search'),
+    url(r'^metricas/$', views.request_metrics, name='request_metrics'),
+    url(r'^metricas/cache/$', views.cache_metrics, name='cache_metrics'),
 ]
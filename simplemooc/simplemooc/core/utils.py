@@ -1,3 +1,4 @@
+import csv
 import hashlib
 import string
 import random
@@ -11,3 +12,14 @@ def generate_hash_key(salt, random_str_size=5):
     text = random_str + salt
     return hashlib.sha224(text.encode('utf-8')).hexdigest()
 
+def csv_identifiers(lines, header=('username', 'email', 'e-mail')):
+    """Primeira coluna de cada linha do CSV, ignorando linhas vazias,
+    comentários (#) e o cabeçalho."""
+    for row in csv.reader(lines):
+        if not row or not row[0].strip() or row[0].startswith('#'):
+            continue
+        identifier = row[0].strip()
+        if identifier.lower() in header:
+            continue
+        yield identifier
+
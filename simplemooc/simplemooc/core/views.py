@@ -1,6 +1,14 @@
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render
 
+from simplemooc.core import metrics
+from simplemooc.core.cache import cache_stats
+from simplemooc.core.search import SearchResults, doc_type_for
+from simplemooc.courses.cache import get_my_courses
+from simplemooc.courses.models import Course, Enrollment, Lesson
+
 
 def home(request):
     return render(request, 'home.html')
@@ -8,3 +16,62 @@ def home(request):
 
 def contact(request):
     return render(request, 'contact.html')
+
+
+def visible_course_ids(user):
+    """Cursos cujo conteúdo ``user`` pode ver na busca (``None`` = todos)."""
+    if user.is_staff:
+        return None
+    if not user.is_authenticated():
+        return []
+    enrollments = get_my_courses(user.pk)
+    if enrollments is None:
+        enrollments = Enrollment.objects.refresh_my_courses(user.pk)
+    return [
+        enrollment.course.pk for enrollment in enrollments
+        if enrollment.is_approved()
+    ]
+
+
+def released_lesson_ids(course_ids):
+    """Aulas já liberadas pelo cronograma de cada curso, ambos em cache."""
+    return [
+        lesson.pk for course_id in course_ids
+        for lesson in Course(pk=course_id).release_lessons()
+    ]
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {'query': query}
+    if query:
+        course_ids = visible_course_ids(request.user)
+        object_ids = None
+        if course_ids is not None:
+            # Aulas ainda não liberadas ficam fora, como na página do curso.
+            object_ids = {
+                doc_type_for(Lesson): released_lesson_ids(course_ids)}
+        results = SearchResults(
+            query, course_ids=course_ids, object_ids=object_ids)
+        paginator = Paginator(results, 10)
+        try:
+            page = paginator.page(request.GET.get('page'))
+        except PageNotAnInteger:
+            page = paginator.page(1)
+        except EmptyPage:
+            page = paginator.page(paginator.num_pages)
+        context['page_obj'] = page
+        context['paginator'] = paginator
+    return render(request, 'search.html', context)
+
+
+@staff_member_required
+def cache_metrics(request):
+    """Contadores de acerto e falta do cache neste processo."""
+    return JsonResponse(cache_stats())
+
+
+@staff_member_required
+def request_metrics(request):
+    """Tempos das requisições por view neste processo."""
+    return JsonResponse({'views': metrics.stats(), 'cache': cache_stats()})
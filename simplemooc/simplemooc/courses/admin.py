@@ -1,6 +1,11 @@
-from django.contrib import admin
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
 
-from .models import Announcement, Comment, Course, Enrollment, Lesson, Material
+from .forms import ImportEnrollmentsForm
+from .models import (Announcement, AnnouncementMail, Comment, Course,
+                     Enrollment, Lesson, Material)
 
 
 class CourseAdmin(admin.ModelAdmin):
@@ -23,6 +28,67 @@ class LessonAdmin(admin.ModelAdmin):
     ]
 
 
+class AnnouncementMailAdmin(admin.ModelAdmin):
+    list_display = ['announcement', 'recipients', 'created_at', 'sent_at']
+    list_filter = ['sent_at']
+    readonly_fields = [
+        'recipients', 'last_enrollment', 'claimed_at', 'sent_at']
+
+
+class EnrollmentAdmin(admin.ModelAdmin):
+    list_display = ['user', 'course', 'status', 'created_at']
+    list_filter = ['status', 'course']
+    search_fields = ['user__username', 'user__email']
+    list_select_related = ['user', 'course']
+    raw_id_fields = ['user']
+    actions = ['approve', 'cancel']
+
+    def approve(self, request, queryset):
+        updated = queryset.set_status(1)
+        self.message_user(request, '%d inscrição(ões) aprovada(s).' % updated)
+    approve.short_description = 'Aprovar as inscrições selecionadas'
+
+    def cancel(self, request, queryset):
+        updated = queryset.set_status(2)
+        self.message_user(
+            request, '%d inscrição(ões) cancelada(s).' % updated)
+    cancel.short_description = 'Cancelar as inscrições selecionadas'
+
+    def get_urls(self):
+        return [
+            url(r'^importar/$',
+                self.admin_site.admin_view(self.import_view),
+                name='courses_enrollment_import'),
+        ] + super(EnrollmentAdmin, self).get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            return redirect('admin:courses_enrollment_changelist')
+        form = ImportEnrollmentsForm(
+            request.POST or None, request.FILES or None)
+        if form.is_valid():
+            result, sent = form.save()
+            self.message_user(
+                request, '%d criada(s), %d alterada(s), %d mantida(s), '
+                '%d e-mail(s) enviado(s).' % (
+                    result.created, result.updated, result.unchanged, sent))
+            if result.missing:
+                self.message_user(
+                    request, 'Usuários não encontrados: %s' % ', '.join(
+                        result.missing[:50]), messages.WARNING)
+            return redirect('admin:courses_enrollment_changelist')
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta, form=form,
+            title='Importar inscrições',
+        )
+        return TemplateResponse(
+            request, 'admin/courses/enrollment/import.html', context)
+
+
 admin.site.register(Course, CourseAdmin)
-admin.site.register([Announcement, Comment, Enrollment, Material])
+admin.site.register(Enrollment, EnrollmentAdmin)
+admin.site.register(AnnouncementMail, AnnouncementMailAdmin)
+admin.site.register([Announcement, Comment, Material])
 admin.site.register(Lesson, LessonAdmin)
@@ -0,0 +1,272 @@
+import datetime
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from simplemooc.core.cache import bump_version, get_or_compute
+from simplemooc.core.pagecache import invalidate_pages
+
+ACCESS_TIMEOUT = 60 * 60
+MY_COURSES_TIMEOUT = 60 * 60 * 24
+# Cronograma sem nenhuma mudança prevista; os sinais de Lesson o invalidam.
+SCHEDULE_TIMEOUT = 60 * 60 * 24 * 7
+CONTENT_TIMEOUT = 60 * 60 * 24 * 7
+FEED_TIMEOUT = 60 * 60 * 24
+
+CATALOG_VERSION_KEY = 'courses:catalog:version'
+
+# Guardado no cache quando o usuário não tem inscrição no curso, para
+# diferenciar de uma chave ausente.
+NOT_ENROLLED = -1
+
+
+def course_key(slug):
+    return 'courses:course:%s' % slug
+
+
+def course_page_key(slug):
+    return 'courses:page:%s' % slug
+
+
+def enrollment_key(user_id, slug):
+    return 'courses:enrollment:%s:%s' % (user_id, slug)
+
+
+def my_courses_key(user_id):
+    return 'courses:my_courses:%s' % user_id
+
+
+def schedule_key(course_id):
+    return 'courses:schedule:%s' % course_id
+
+
+def content_key(course_id):
+    return 'courses:content:%s' % course_id
+
+
+def feed_key(course_id):
+    return 'courses:announcements:%s' % course_id
+
+
+def catalog_key(version):
+    return 'courses:catalog:%s' % version
+
+
+class CourseSummary(namedtuple(
+        'CourseSummary', 'pk name slug description start_date')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+
+class EnrollmentSummary(namedtuple('EnrollmentSummary', 'course status')):
+    __slots__ = ()
+
+    def is_approved(self):
+        return self.status == 1
+
+
+class MaterialNode(object):
+    __slots__ = ('pk', 'lesson_id', 'name', 'embedded', 'file_name')
+
+    def __init__(self, pk, lesson_id, name, embedded, file_name):
+        self.pk = pk
+        self.lesson_id = lesson_id
+        self.name = name
+        self.embedded = embedded
+        self.file_name = file_name
+
+    def __str__(self):
+        return self.name
+
+    def is_embedded(self):
+        return bool(self.embedded)
+
+
+class LessonNode(object):
+    __slots__ = ('pk', 'name', 'description', 'number', 'release_date',
+                 'materials')
+
+    def __init__(self, pk, name, description, number, release_date,
+                 materials=()):
+        self.pk = pk
+        self.name = name
+        self.description = description
+        self.number = number
+        self.release_date = release_date
+        self.materials = tuple(materials)
+
+    def __str__(self):
+        return self.name
+
+
+class CourseContent(namedtuple('CourseContent', 'lessons')):
+    """Aulas do curso, na ordem de ``Lesson.Meta.ordering``, e seus
+    materiais."""
+    __slots__ = ()
+
+    def get_lesson(self, lesson_id):
+        for lesson in self.lessons:
+            if lesson.pk == lesson_id:
+                return lesson
+        return None
+
+    def get_material(self, material_id):
+        for lesson in self.lessons:
+            for material in lesson.materials:
+                if material.pk == material_id:
+                    return material
+        return None
+
+
+class ReleaseSchedule(namedtuple(
+        'ReleaseSchedule', 'lessons available changes_on')):
+    """Aulas do curso e quais estão liberadas até ``changes_on``.
+
+    Uma aula está liberada enquanto ``release_date >= hoje``, então o
+    cronograma só muda no dia seguinte à menor data entre as liberadas.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, lessons, today):
+        lessons = tuple(lessons)
+        released = [
+            lesson for lesson in lessons
+            if lesson.release_date and lesson.release_date >= today
+        ]
+        changes_on = None
+        if released:
+            changes_on = min(lesson.release_date for lesson in released) + \
+                datetime.timedelta(days=1)
+        return cls(lessons, frozenset(lesson.pk for lesson in released),
+                   changes_on)
+
+    def is_available(self, lesson_id):
+        return lesson_id in self.available
+
+    def available_lessons(self):
+        return [lesson for lesson in self.lessons
+                if lesson.pk in self.available]
+
+
+def get_course_access(user_id, slug):
+    """Retorna ``(course, status)`` do cache ou ``None`` se não estiver lá.
+
+    ``status`` é ``None`` quando o usuário não está inscrito no curso.
+    """
+    keys = [course_key(slug), enrollment_key(user_id, slug)]
+    cached = cache.get_many(keys)
+    if len(cached) != len(keys):
+        return None
+    status = cached[keys[1]]
+    return cached[keys[0]], None if status == NOT_ENROLLED else status
+
+
+def set_course_access(user_id, course, status):
+    cache.set_many({
+        course_key(course.slug): course,
+        enrollment_key(user_id, course.slug):
+            NOT_ENROLLED if status is None else status,
+    }, ACCESS_TIMEOUT)
+
+
+def invalidate_course(course):
+    # Com o atalho trocado, as chaves do atalho antigo também saem.
+    slugs = {course.slug, getattr(course, '_saved_slug', None)} - {None}
+    cache.delete_many([key(slug) for slug in slugs
+                       for key in (course_key, course_page_key)])
+
+
+def invalidate_enrollment(user_id, slug):
+    cache.delete(enrollment_key(user_id, slug))
+
+
+def invalidate_enrollments(pairs):
+    """Invalida vários pares ``(user_id, slug)`` de uma vez."""
+    keys = [enrollment_key(user_id, slug) for user_id, slug in pairs]
+    cache.delete_many(keys + [my_courses_key(user_id) for user_id, _ in pairs])
+
+
+def get_my_courses(user_id):
+    return cache.get(my_courses_key(user_id))
+
+
+def set_my_courses(user_id, summaries):
+    cache.set(my_courses_key(user_id), summaries, MY_COURSES_TIMEOUT)
+
+
+def invalidate_my_courses(user_ids):
+    cache.delete_many([my_courses_key(user_id) for user_id in user_ids])
+
+
+def get_release_schedule(course_id, today):
+    schedule = cache.get(schedule_key(course_id))
+    if schedule is not None and schedule.changes_on is not None and \
+            today >= schedule.changes_on:
+        return None
+    return schedule
+
+
+def set_release_schedule(course_id, schedule, now):
+    timeout = SCHEDULE_TIMEOUT
+    if schedule.changes_on is not None:
+        # Expira à meia-noite do dia em que o cronograma muda.
+        changes_at = datetime.datetime.combine(
+            schedule.changes_on, datetime.time()).replace(tzinfo=now.tzinfo)
+        timeout = max(int((changes_at - now).total_seconds()) + 1, 1)
+    cache.set(schedule_key(course_id), schedule, timeout)
+
+
+def get_content(course_id):
+    return cache.get(content_key(course_id))
+
+
+def set_content(course_id, content):
+    cache.set(content_key(course_id), content, CONTENT_TIMEOUT)
+
+
+def invalidate_content(course_id):
+    # O cronograma é montado a partir do conteúdo e sai junto com ele.
+    cache.delete_many([content_key(course_id), schedule_key(course_id)])
+
+
+def load_course(slug, compute):
+    """Curso da página de detalhes; só um processo por vez chama
+    ``compute`` quando ele sai do cache."""
+    return get_or_compute(course_page_key(slug), compute, ACCESS_TIMEOUT)
+
+
+def catalog_version():
+    """Versão do catálogo, trocada a cada alteração de Course ou Lesson."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = bump_version(CATALOG_VERSION_KEY, cache)
+    return version
+
+
+def load_catalog(version, compute):
+    return get_or_compute(catalog_key(version), compute,
+                          settings.COURSES_CATALOG_CACHE_TIMEOUT)
+
+
+def invalidate_catalog():
+    bump_version(CATALOG_VERSION_KEY, cache)
+    # As páginas dos cursos para anônimos mostram o catálogo e o ETag
+    # delas depende da versão.
+    invalidate_pages('courses')
+
+
+def get_announcement_feed(course_id):
+    return cache.get(feed_key(course_id))
+
+
+def set_announcement_feed(course_id, announcements):
+    cache.set(feed_key(course_id), announcements, FEED_TIMEOUT)
+
+
+def invalidate_announcement_feed(course_id):
+    cache.delete(feed_key(course_id))
+
@@ -1,29 +1,46 @@
 from django.contrib import messages
-from django.shortcuts import get_object_or_404, redirect
+from django.http import Http404
+from django.shortcuts import redirect
 
-from .models import Course, Enrollment
+from simplemooc.core.db import read_from_primary
+
+from .cache import get_course_access, set_course_access
+from .models import Course
+
+
+@read_from_primary()
+def resolve_course_access(user, slug):
+    access = get_course_access(user.pk, slug)
+    if access is not None:
+        return access
+
+    course = Course.objects.with_enrollment_status(user).filter(
+        slug=slug).first()
+    if course is None:
+        raise Http404('Curso não encontrado.')
+
+    # O curso vai para o cache compartilhado entre os usuários, então a
+    # situação da inscrição não fica no objeto.
+    status = course.__dict__.pop('enrollment_status')
+    set_course_access(user.pk, course, status)
+    return course, status
 
 
 def enrollment_required(view_func):
     def _wrapper(request, *args, **kwargs):
         slug = kwargs['slug']
-        course = get_object_or_404(Course, slug=slug)
+        course, status = resolve_course_access(request.user, slug)
         has_permission = request.user.is_staff
 
         if not has_permission:
-            try:
-                enrollment = Enrollment.objects.get(
-                    user=request.user, course=course
-                )
-            except Enrollment.DoesNotExist:
+            if status is None:
                 message = 'Desculpe, mas você não tem permissão para ' \
                     + 'acessar esta página'
+            elif status == 1:
+                has_permission = True
             else:
-                if enrollment.is_approved():
-                    has_permission = True
-                else:
-                    message = 'A sua inscrição no curso ainda está ' \
-                        + 'está pendente.'
+                message = 'A sua inscrição no curso ainda está ' \
+                    + 'está pendente.'
 
         if not has_permission:
             messages.error(request, message)
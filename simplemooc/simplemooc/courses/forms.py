@@ -1,9 +1,12 @@
+import io
+
 from django import forms
 from django.conf import settings
 
 from simplemooc.core.mail import send_mail_template
+from simplemooc.core.utils import csv_identifiers
 
-from .models import Comment
+from .models import Comment, Course, Enrollment
 
 
 class ContactCourse(forms.Form):
@@ -29,3 +32,32 @@ class CommentForm(forms.ModelForm):
     class Meta:
         model = Comment
         fields = ['comment']
+
+
+class ImportEnrollmentsForm(forms.Form):
+    course = forms.ModelChoiceField(
+        label='Curso', queryset=Course.objects.only('name'))
+    file = forms.FileField(
+        label='Arquivo CSV',
+        help_text='Nome de usuário ou e-mail na primeira coluna.')
+    status = forms.TypedChoiceField(
+        label='Situação', choices=Enrollment.STATUS_CHOICE, coerce=int,
+        initial=1)
+    notify = forms.BooleanField(
+        label='Avisar por e-mail quem for aprovado', required=False)
+
+    def save(self):
+        course = self.cleaned_data['course']
+        # Lido linha a linha a partir do upload, sem carregar o arquivo.
+        lines = io.TextIOWrapper(
+            self.cleaned_data['file'].file, encoding='utf-8-sig')
+        result = Enrollment.objects.bulk_enroll(
+            course, csv_identifiers(lines),
+            status=self.cleaned_data['status'])
+        sent = 0
+        if self.cleaned_data['notify'] and result.approved:
+            sent = Enrollment.objects.notify_approved(
+                course, result.approved,
+                chunk_size=settings.ANNOUNCEMENT_MAIL_CHUNK_SIZE)
+        return result, sent
+
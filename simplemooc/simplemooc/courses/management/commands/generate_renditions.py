@@ -0,0 +1,39 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from simplemooc.core import renditions
+from simplemooc.courses.models import Course
+
+
+def _generate(name):
+    try:
+        return name, len(renditions.generate(name)), None
+    except (IOError, OSError) as exc:
+        return name, 0, str(exc)
+
+
+class Command(BaseCommand):
+    help = 'Gera novamente as versões reduzidas das imagens dos cursos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Processos usados; por padrão um por CPU.'
+        )
+
+    def handle(self, *args, **options):
+        names = list(Course.objects.exclude(image='').exclude(
+            image__isnull=True).order_by('image').values_list(
+                'image', flat=True).distinct())
+        # Os processos filhos não usam o banco; a conexão herdada no fork
+        # não pode ser compartilhada.
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            for name, total, error in executor.map(_generate, names):
+                if error:
+                    self.stderr.write('%s: %s' % (name, error))
+                else:
+                    self.stdout.write('%s: %d versão(ões).' % (name, total))
@@ -0,0 +1,57 @@
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from simplemooc.core.utils import csv_identifiers
+from simplemooc.courses.models import Course, Enrollment
+
+
+class Command(BaseCommand):
+    help = 'Inscreve num curso os usuários listados num arquivo CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Atalho (slug) do curso.')
+        parser.add_argument(
+            'csv', help='Arquivo CSV com nome de usuário ou e-mail na '
+                        'primeira coluna; "-" lê da entrada padrão.')
+        parser.add_argument(
+            '--status', type=int, default=1,
+            choices=[value for value, _ in Enrollment.STATUS_CHOICE],
+            help='Situação das inscrições (padrão: 1, aprovado).'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--notify', action='store_true',
+            help='Envia e-mail para quem teve a inscrição aprovada.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(slug=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError('Curso "%s" não encontrado.' % options['course'])
+
+        if options['csv'] == '-':
+            result = self.enroll(course, sys.stdin, options)
+        else:
+            with open(options['csv'], newline='',
+                      encoding='utf-8-sig') as csv_file:
+                result = self.enroll(course, csv_file, options)
+
+        self.stdout.write(
+            '%d criada(s), %d alterada(s), %d mantida(s).' % (
+                result.created, result.updated, result.unchanged))
+        for identifier in result.missing:
+            self.stderr.write('Usuário não encontrado: %s' % identifier)
+
+        if options['notify'] and result.approved:
+            sent = Enrollment.objects.notify_approved(
+                course, result.approved,
+                chunk_size=settings.ANNOUNCEMENT_MAIL_CHUNK_SIZE)
+            self.stdout.write('%d e-mail(s) enviado(s).' % sent)
+
+    def enroll(self, course, csv_file, options):
+        return Enrollment.objects.bulk_enroll(
+            course, csv_identifiers(csv_file), status=options['status'],
+            chunk_size=options['chunk_size'])
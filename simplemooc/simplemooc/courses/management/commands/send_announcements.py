@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from simplemooc.courses.models import AnnouncementMail
+
+
+class Command(BaseCommand):
+    help = 'Envia os e-mails pendentes dos anúncios para os alunos inscritos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int,
+            default=settings.ANNOUNCEMENT_MAIL_CHUNK_SIZE,
+            help='Quantidade de mensagens enviadas por lote na conexão.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Número máximo de anúncios processados nesta execução.'
+        )
+
+    def handle(self, *args, **options):
+        pending = AnnouncementMail.objects.pending().select_related(
+            'announcement')
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        connection = get_connection()
+        for mail in pending:
+            if not mail.claim():
+                continue
+            try:
+                sent = mail.send(
+                    chunk_size=options['chunk_size'], connection=connection)
+            except Exception as exc:
+                # O progresso fica gravado: a próxima execução continua
+                # a partir do último lote enviado.
+                mail.release()
+                self.stderr.write(
+                    'Falha ao enviar "%s": %s' % (mail.announcement, exc))
+                continue
+            self.stdout.write(
+                '"%s" enviado para %d aluno(s).' % (mail.announcement, sent))
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_auto_20230630_1413'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnouncementMail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipients', models.IntegerField(blank=True, default=0, verbose_name='Destinatários')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Enviado em')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('announcement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mail', to='courses.Announcement', verbose_name='Anúncio')),
+            ],
+            options={
+                'verbose_name': 'E-mail de Anúncio',
+                'verbose_name_plural': 'E-mails de Anúncios',
+                'ordering': ['created_at'],
+            },
+        ),
+    ]
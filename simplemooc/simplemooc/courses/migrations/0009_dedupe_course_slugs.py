@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def dedupe_slugs(apps, schema_editor):
+    # Antes do slug ser único: o curso mais antigo mantém o slug e os
+    # demais ganham um sufixo numérico (python-2, python-3, ...).
+    Course = apps.get_model('courses', 'Course')
+    duplicated = Course.objects.values('slug').annotate(
+        total=Count('pk')).filter(total__gt=1).values_list('slug', flat=True)
+    for slug in list(duplicated):
+        courses = Course.objects.filter(slug=slug).order_by('pk')
+        suffix = 1
+        for course in list(courses)[1:]:
+            while True:
+                suffix += 1
+                candidate = '%s-%d' % (slug[:50 - len(str(suffix)) - 1],
+                                       suffix)
+                if not Course.objects.filter(slug=candidate).exists():
+                    break
+            course.slug = candidate
+            course.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_announcementmail'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_slugs, migrations.RunPython.noop),
+    ]
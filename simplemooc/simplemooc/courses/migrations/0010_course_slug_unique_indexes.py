@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_dedupe_course_slugs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='course',
+            name='slug',
+            field=models.SlugField(unique=True, verbose_name='Atalho'),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['course', 'created_at'],
+                               name='courses_ann_course__a7da64_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['course', 'status'],
+                               name='courses_enr_course__78d524_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lesson',
+            index=models.Index(fields=['course', 'number'],
+                               name='courses_les_course__43ad8e_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_slug_unique_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcementmail',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Em envio desde'),
+        ),
+        migrations.AddField(
+            model_name='announcementmail',
+            name='last_enrollment',
+            field=models.IntegerField(blank=True, default=0, verbose_name='Última inscrição enviada'),
+        ),
+    ]
@@ -1,21 +1,46 @@
+import datetime
+from collections import namedtuple
+from itertools import islice
+
 from django.conf import settings
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
-from simplemooc.core.mail import send_mail_template
+from simplemooc.core import renditions, search
+from simplemooc.core.db import read_from_primary
+from simplemooc.core.mail import send_mass_mail_template
+
+from .cache import (CourseContent, CourseSummary, EnrollmentSummary,
+                    LessonNode, MaterialNode, ReleaseSchedule,
+                    get_announcement_feed, get_content, get_release_schedule,
+                    invalidate_announcement_feed, invalidate_catalog,
+                    invalidate_content, invalidate_course,
+                    invalidate_enrollment, invalidate_enrollments,
+                    invalidate_my_courses, set_announcement_feed,
+                    set_content, set_my_courses, set_release_schedule)
 
 
 class CourseManager(models.Manager):
 
     def search(self, query):
-        return self.get_queryset().filter(models.Q(name__icontains=query) |
-                                          models.Q(description__icontains=query))
+        return search.search_queryset(self.get_queryset(), query)
+
+    def with_enrollment_status(self, user):
+        # Situação da inscrição de ``user`` anotada no próprio curso, para
+        # resolver curso e permissão numa única consulta.
+        enrollment = Enrollment.objects.filter(
+            course=models.OuterRef('pk'), user_id=user.pk
+        ).values('status')[:1]
+        return self.get_queryset().annotate(
+            enrollment_status=models.Subquery(enrollment))
 
 
 class Course(models.Model):
 
     name = models.CharField("Nome", max_length=100)
-    slug = models.SlugField("Atalho")
+    slug = models.SlugField("Atalho", unique=True)
     description = models.TextField("Descrição simples", blank=True)
     about = models.TextField("Sobre o curso", blank=True)
     start_date = models.DateField(
@@ -28,13 +53,50 @@ class Course(models.Model):
     update_at = models.DateTimeField(
         'Atualizado em', auto_now=True, auto_now_add=False)
 
+    def __init__(self, *args, **kwargs):
+        super(Course, self).__init__(*args, **kwargs)
+        # Imagem gravada no banco, para saber quando ela é trocada.
+        image = self.__dict__.get('image')
+        self._saved_image = getattr(image, 'name', image) or ''
+        # Atalho gravado no banco: o cache guarda o curso por atalho.
+        self._saved_slug = self.__dict__.get('slug')
+
     @models.permalink
     def get_absolute_url(self):
         return ("courses:details", (), {"slug": self.slug})
 
+    def content(self):
+        """Árvore de aulas e materiais do curso, lida em duas consultas e
+        guardada no cache."""
+        content = get_content(self.pk)
+        if content is None:
+            with read_from_primary():
+                lessons = self.lessons.prefetch_related('materials')
+                content = CourseContent(tuple(
+                    LessonNode(
+                        lesson.pk, lesson.name, lesson.description,
+                        lesson.number, lesson.release_date, [
+                            MaterialNode(
+                                material.pk, lesson.pk, material.name,
+                                material.embedded, material.file.name or '')
+                            for material in lesson.materials.all()
+                        ]
+                    ) for lesson in lessons
+                ))
+            set_content(self.pk, content)
+        return content
+
+    def release_schedule(self):
+        now = timezone.now()
+        schedule = get_release_schedule(self.pk, now.date())
+        if schedule is None:
+            schedule = ReleaseSchedule.build(
+                self.content().lessons, now.date())
+            set_release_schedule(self.pk, schedule, now)
+        return schedule
+
     def release_lessons(self):
-        today = timezone.now().date()
-        return self.lessons.filter(release_date__gte=today)
+        return self.release_schedule().available_lessons()
 
     class Meta:
         verbose_name = "Curso"
@@ -64,6 +126,10 @@ class Lesson(models.Model):
     def __str__(self):
         return self.name
 
+    @models.permalink
+    def get_absolute_url(self):
+        return ("courses:lesson", (), {"slug": self.course.slug, "pk": self.pk})
+
     def is_available(self):
         if self.release_date:
             today = timezone.now().date()
@@ -74,6 +140,10 @@ class Lesson(models.Model):
         verbose_name = 'Aula'
         verbose_name_plural = 'Aulas'
         ordering = ['number']
+        indexes = [
+            # Árvore de conteúdo: course_id = ? ORDER BY number.
+            models.Index(fields=['course', 'number']),
+        ]
 
 
 class Material(models.Model):
@@ -96,6 +166,126 @@ class Material(models.Model):
         verbose_name_plural = 'Materiais'
 
 
+# Tentativas de cada lote de bulk_enroll em caso de conflito.
+BULK_ENROLL_ATTEMPTS = 3
+
+BulkEnrollment = namedtuple(
+    'BulkEnrollment', 'created updated unchanged missing approved')
+
+
+class EnrollmentQuerySet(models.QuerySet):
+
+    def set_status(self, status):
+        """Altera a situação com um único UPDATE e limpa os caches que os
+        sinais de ``save()`` limpariam."""
+        queryset = self.exclude(status=status)
+        pairs = list(queryset.values_list('user_id', 'course__slug'))
+        if not pairs:
+            return 0
+        updated = queryset.update(status=status)
+        invalidate_enrollments(pairs)
+        return updated
+
+
+class EnrollmentManager(models.Manager.from_queryset(EnrollmentQuerySet)):
+
+    def bulk_enroll(self, course, identifiers, status=1, chunk_size=1000):
+        """Inscreve em ``course`` os usuários de ``identifiers`` (nomes de
+        usuário ou e-mails), lidos em lotes de ``chunk_size``.
+
+        Retorna um ``BulkEnrollment`` com as quantidades de inscrições
+        criadas, alteradas e mantidas, os identificadores sem usuário e os
+        e-mails de quem passou a ter a inscrição aprovada.
+        """
+        User = get_user_model()
+        created = updated = unchanged = 0
+        missing = []
+        approved = []
+        identifiers = iter(identifiers)
+
+        while True:
+            chunk = list(islice(identifiers, chunk_size))
+            if not chunk:
+                break
+            users = {}
+            found = set()
+            for pk, username, email in User.objects.filter(
+                    models.Q(username__in=chunk) | models.Q(email__in=chunk)
+            ).values_list('pk', 'username', 'email'):
+                users[pk] = email
+                found.update((username, email))
+            missing.extend(
+                identifier for identifier in chunk if identifier not in found)
+
+            for attempt in range(1, BULK_ENROLL_ATTEMPTS + 1):
+                try:
+                    with transaction.atomic():
+                        existing = self._statuses(course, list(users))
+                        # Sem ignore_conflicts no Django 1.11: só entram as
+                        # linhas que ainda não existem.
+                        new = [pk for pk in users if pk not in existing]
+                        self.bulk_create([
+                            self.model(user_id=pk, course=course,
+                                       status=status)
+                            for pk in new
+                        ], batch_size=chunk_size)
+                        changed = [pk for pk, current in existing.items()
+                                   if current != status]
+                        if changed:
+                            self.filter(
+                                course=course, user_id__in=changed
+                            ).update(status=status)
+                    break
+                except IntegrityError:
+                    # Um aluno se inscreveu sozinho entre a leitura e o
+                    # INSERT (o select_for_update não trava linhas que
+                    # ainda não existem); o lote é relido e refeito.
+                    if attempt == BULK_ENROLL_ATTEMPTS:
+                        raise
+
+            created += len(new)
+            updated += len(changed)
+            unchanged += len(existing) - len(changed)
+            invalidate_enrollments(
+                [(pk, course.slug) for pk in new + changed])
+            if status == 1:
+                approved.extend(
+                    users[pk] for pk in new + changed if users[pk])
+
+        return BulkEnrollment(created, updated, unchanged, missing, approved)
+
+    def _statuses(self, course, user_ids):
+        return dict(self.filter(
+            course=course, user_id__in=user_ids
+        ).select_for_update().values_list('user_id', 'status'))
+
+    def notify_approved(self, course, emails, chunk_size=100,
+                        connection=None):
+        """Avisa por e-mail, em lotes, que a inscrição foi aprovada."""
+        context = {'course': course}
+        results = send_mass_mail_template(
+            'Inscrição aprovada: %s' % course, 'courses/enrollment_mail.html',
+            ((context, [email]) for email in emails),
+            batch_size=chunk_size, connection=connection
+        )
+        return sum(1 for _, sent in results if sent)
+
+    @read_from_primary()
+    def refresh_my_courses(self, user_id):
+        # Resumo desnormalizado das inscrições do usuário usado pelo menu
+        # e pelo painel, montado numa única consulta e gravado no cache.
+        rows = self.get_queryset().filter(user_id=user_id).order_by(
+            'pk').values_list(
+                'course_id', 'course__name', 'course__slug',
+                'course__description', 'course__start_date', 'status')
+        summaries = [
+            EnrollmentSummary(CourseSummary(*row[:5]), row[5])
+            for row in rows
+        ]
+        set_my_courses(user_id, summaries)
+        return summaries
+
+
 class Enrollment(models.Model):
 
     STATUS_CHOICE = (
@@ -116,6 +306,8 @@ class Enrollment(models.Model):
     update_at = models.DateTimeField(
         'Atualizado em', auto_now=True, auto_now_add=False)
 
+    objects = EnrollmentManager()
+
     def is_approved(self):
         return self.status == 1
 
@@ -123,6 +315,34 @@ class Enrollment(models.Model):
         verbose_name = 'Inscrição'
         verbose_name_plural = 'Inscrições'
         unique_together = (('user', 'course'),)
+        indexes = [
+            # Destinatários dos anúncios e alunos aprovados de um curso.
+            models.Index(fields=['course', 'status']),
+        ]
+
+
+class AnnouncementManager(models.Manager):
+
+    def feed_queryset(self, course_id):
+        # Contagem em subconsulta em vez de GROUP BY: assim a listagem
+        # segue o índice (course, created_at) sem ordenar em memória.
+        comments = Comment.objects.filter(
+            announcement=models.OuterRef('pk')
+        ).order_by().values('announcement').annotate(
+            count=models.Count('pk')).values('count')
+        return self.get_queryset().filter(course_id=course_id).annotate(
+            comments_count=Coalesce(
+                models.Subquery(comments, output_field=models.IntegerField()),
+                0))
+
+    def feed(self, course_id):
+        """Anúncios do curso com ``comments_count``, lidos do cache."""
+        announcements = get_announcement_feed(course_id)
+        if announcements is None:
+            with read_from_primary():
+                announcements = list(self.feed_queryset(course_id))
+            set_announcement_feed(course_id, announcements)
+        return announcements
 
 
 class Announcement(models.Model):
@@ -135,13 +355,23 @@ class Announcement(models.Model):
     update_at = models.DateTimeField(
         'Atualizado em', auto_now=True, auto_now_add=False)
 
+    objects = AnnouncementManager()
+
     def __str__(self):
         return self.title
 
+    @models.permalink
+    def get_absolute_url(self):
+        return ("courses:show_announcement", (),
+                {"slug": self.course.slug, "pk": self.pk})
+
     class Meta:
         verbose_name = 'Anúncio'
         verbose_name_plural = 'Anúncios'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['course', 'created_at']),
+        ]
 
 
 class Comment(models.Model):
@@ -160,22 +390,202 @@ class Comment(models.Model):
         ordering = ['created_at']
 
 
-def post_save_announcement(instance, created, **kwargs):
-    if created:
-        subject = instance.title
-        context = {
-            'announcement': instance
-        }
+class AnnouncementMailManager(models.Manager):
+
+    def pending(self):
+        """Envios não concluídos e sem worker, ou cujo worker parou de dar
+        sinal há mais de ``ANNOUNCEMENT_MAIL_LEASE`` segundos."""
+        expired = timezone.now() - datetime.timedelta(
+            seconds=settings.ANNOUNCEMENT_MAIL_LEASE)
+        return self.get_queryset().filter(sent_at__isnull=True).filter(
+            models.Q(claimed_at__isnull=True) |
+            models.Q(claimed_at__lt=expired))
+
+
+class AnnouncementMail(models.Model):
+
+    template_name = 'courses/announcement_mail.html'
+
+    announcement = models.OneToOneField(
+        Announcement, verbose_name='Anúncio', related_name='mail')
+    recipients = models.IntegerField('Destinatários', default=0, blank=True)
+    # Inscrição do último aluno que já recebeu o e-mail: um envio
+    # interrompido continua a partir dela.
+    last_enrollment = models.IntegerField(
+        'Última inscrição enviada', default=0, blank=True)
+    claimed_at = models.DateTimeField('Em envio desde', null=True, blank=True)
+    sent_at = models.DateTimeField('Enviado em', null=True, blank=True)
+    created_at = models.DateTimeField(
+        'Criado em', auto_now=False, auto_now_add=True)
 
-        template_name = 'courses/announcement_mail.html'
-        enrollments = Enrollment.objects.filter(
-            course=instance.course, status=1)
+    objects = AnnouncementMailManager()
 
-        for enrollment in enrollments:
-            recipient_list = [enrollment.user.email]
-            send_mail_template(subject, template_name, context, recipient_list)
+    def __str__(self):
+        return str(self.announcement)
+
+    def claim(self):
+        # Reserva o envio para este worker; se ele morrer, a reserva vence
+        # e outro worker continua de onde o envio parou.
+        now = timezone.now()
+        claimed = AnnouncementMail.objects.pending().filter(
+            pk=self.pk).update(claimed_at=now)
+        if claimed:
+            self.claimed_at = now
+        return bool(claimed)
+
+    def release(self):
+        AnnouncementMail.objects.filter(pk=self.pk).update(claimed_at=None)
+        self.claimed_at = None
+
+    def get_recipients(self):
+        return Enrollment.objects.filter(
+            course_id=self.announcement.course_id, status=1,
+            pk__gt=self.last_enrollment
+        ).order_by('pk').values_list('pk', 'user__email')
+
+    def send(self, chunk_size=None, connection=None,
+             from_email=settings.DEFAULT_FROM_EMAIL):
+        """Envia para os alunos que ainda não receberam, em lotes de
+        ``chunk_size``, gravando o progresso depois de cada lote."""
+        chunk_size = chunk_size or settings.ANNOUNCEMENT_MAIL_CHUNK_SIZE
+        # O mesmo contexto para todos os alunos: o template é renderizado
+        # uma única vez por send_mass_mail_template.
+        context = {'announcement': self.announcement}
+        while True:
+            chunk = list(self.get_recipients()[:chunk_size])
+            if not chunk:
+                break
+            results = send_mass_mail_template(
+                self.announcement.title, self.template_name,
+                ((context, [email]) for _, email in chunk),
+                from_email=from_email, batch_size=chunk_size,
+                connection=connection
+            )
+            self.recipients += sum(1 for _, sent in results if sent)
+            self.last_enrollment = chunk[-1][0]
+            self.claimed_at = timezone.now()
+            self.save(update_fields=[
+                'recipients', 'last_enrollment', 'claimed_at'])
+
+        self.sent_at = timezone.now()
+        self.claimed_at = None
+        self.save(update_fields=['sent_at', 'claimed_at'])
+        return self.recipients
+
+    class Meta:
+        verbose_name = 'E-mail de Anúncio'
+        verbose_name_plural = 'E-mails de Anúncios'
+        ordering = ['created_at']
+
+
+def post_save_announcement(instance, created, **kwargs):
+    if created:
+        AnnouncementMail.objects.create(announcement=instance)
 
 
 models.signals.post_save.connect(
     post_save_announcement, sender=Announcement,
     dispatch_uid='post_save_announcement')
+
+
+def clear_course_cache(instance, **kwargs):
+    invalidate_course(instance)
+    instance._saved_slug = instance.slug
+    invalidate_catalog()
+    invalidate_my_courses(
+        Enrollment.objects.filter(course=instance).values_list(
+            'user_id', flat=True))
+
+
+def update_image_renditions(instance, **kwargs):
+    if 'image' not in instance.__dict__:
+        return
+    image = instance.image.name or ''
+    if image == instance._saved_image:
+        return
+    if instance._saved_image:
+        renditions.delete(instance._saved_image)
+    if image:
+        renditions.generate(image)
+    instance._saved_image = image
+
+
+def delete_image_renditions(instance, **kwargs):
+    image = instance.image.name if 'image' in instance.__dict__ else \
+        instance._saved_image
+    if image:
+        renditions.delete(image)
+
+
+def clear_announcement_feed(instance, **kwargs):
+    invalidate_announcement_feed(instance.course_id)
+
+
+def clear_comment_feed(instance, **kwargs):
+    course_ids = Announcement.objects.filter(
+        pk=instance.announcement_id).values_list('course_id', flat=True)
+    for course_id in course_ids:
+        invalidate_announcement_feed(course_id)
+
+
+def clear_lesson_content(instance, **kwargs):
+    invalidate_content(instance.course_id)
+    invalidate_catalog()
+
+
+def clear_material_content(instance, **kwargs):
+    course_ids = Lesson.objects.filter(pk=instance.lesson_id).values_list(
+        'course_id', flat=True)
+    for course_id in course_ids:
+        invalidate_content(course_id)
+
+
+def clear_enrollment_cache(instance, **kwargs):
+    invalidate_enrollment(instance.user_id, instance.course.slug)
+    Enrollment.objects.refresh_my_courses(instance.user_id)
+
+
+models.signals.post_save.connect(
+    clear_course_cache, sender=Course, dispatch_uid='post_save_course')
+models.signals.post_delete.connect(
+    clear_course_cache, sender=Course, dispatch_uid='post_delete_course')
+models.signals.post_save.connect(
+    clear_announcement_feed, sender=Announcement,
+    dispatch_uid='post_save_announcement_feed')
+models.signals.post_delete.connect(
+    clear_announcement_feed, sender=Announcement,
+    dispatch_uid='post_delete_announcement_feed')
+models.signals.post_save.connect(
+    clear_comment_feed, sender=Comment, dispatch_uid='post_save_comment')
+models.signals.post_delete.connect(
+    clear_comment_feed, sender=Comment, dispatch_uid='post_delete_comment')
+models.signals.post_save.connect(
+    update_image_renditions, sender=Course,
+    dispatch_uid='update_image_renditions')
+models.signals.post_delete.connect(
+    delete_image_renditions, sender=Course,
+    dispatch_uid='delete_image_renditions')
+models.signals.post_save.connect(
+    clear_lesson_content, sender=Lesson, dispatch_uid='post_save_lesson')
+models.signals.post_delete.connect(
+    clear_lesson_content, sender=Lesson, dispatch_uid='post_delete_lesson')
+models.signals.post_save.connect(
+    clear_material_content, sender=Material,
+    dispatch_uid='post_save_material')
+models.signals.post_delete.connect(
+    clear_material_content, sender=Material,
+    dispatch_uid='post_delete_material')
+models.signals.post_save.connect(
+    clear_enrollment_cache, sender=Enrollment,
+    dispatch_uid='post_save_enrollment')
+models.signals.post_delete.connect(
+    clear_enrollment_cache, sender=Enrollment,
+    dispatch_uid='post_delete_enrollment')
+
+search.register(Course, title='name', body=('description',))
+search.register(
+    Lesson, title='name', body=('description',), course='course_id',
+    related=('course',))
+search.register(
+    Announcement, title='title', body=('content',), course='course_id',
+    related=('course',))
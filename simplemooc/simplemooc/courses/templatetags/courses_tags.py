@@ -1,15 +1,23 @@
 from django.template import Library
 
+from simplemooc.core import renditions
+from simplemooc.courses.cache import get_my_courses
 from simplemooc.courses.models import Enrollment
 
 register = Library()
 
 
+def _my_courses(user):
+    enrollments = get_my_courses(user.pk)
+    if enrollments is None:
+        enrollments = Enrollment.objects.refresh_my_courses(user.pk)
+    return enrollments
+
+
 @register.inclusion_tag('courses/templatetags/my_courses.html')
 def my_courses(user):
-    enrollments = Enrollment.objects.filter(user=user)
     context = {
-        'enrollments': enrollments
+        'enrollments': _my_courses(user)
     }
 
     return context
@@ -17,4 +25,13 @@ def my_courses(user):
 
 @register.assignment_tag()
 def load_my_courses(user):
-    return Enrollment.objects.filter(user=user)
+    return _my_courses(user)
+
+
+@register.inclusion_tag('courses/templatetags/course_image.html')
+def course_image(course, size):
+    context = {'course': course, 'renditions': {}}
+    if course.image:
+        context['renditions'] = renditions.get_urls(course.image.name, size)
+    return context
+
@@ -1,2 +1,7 @@
 from .test_forms import ContactCourseTestCase
-from .test_models import CourseManagerTestCase
+from .test_models import (AnnouncementMailTestCase, BulkEnrollTestCase,
+                          CourseImageRenditionsTestCase, CourseManagerTestCase,
+                          ReleaseScheduleTestCase)
+from .test_views import (AnnouncementsTestCase, CatalogTestCase,
+                         CourseContentTestCase, EnrollmentRequiredTestCase,
+                         MaterialDownloadTestCase, MyCoursesTestCase)
@@ -1,8 +1,25 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from smtplib import SMTPException
 
-from simplemooc.courses.models import Course
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from simplemooc.core import renditions
+from simplemooc.courses.cache import ReleaseSchedule, get_my_courses
+from simplemooc.courses.models import AnnouncementMail, Course, Enrollment
 
 from model_mommy import mommy
+from PIL import Image
 
 
 class CourseManagerTestCase(TestCase):
@@ -25,3 +42,259 @@ class CourseManagerTestCase(TestCase):
         self.assertEqual(len(search), 10)
         search = Course.objects.search("python")
         self.assertEqual(len(search), 20)
+
+    def test_course_search_ranking_and_accents(self):
+        about = mommy.make(
+            "courses.Course", name="Introdução",
+            description="Curso de programação para iniciantes")
+        title = mommy.make("courses.Course", name="Programação Funcional")
+        self.assertEqual(
+            list(Course.objects.search("programacao")), [title, about])
+        title.delete()
+        self.assertEqual(list(Course.objects.search("PROGRAMAÇÕES")), [about])
+
+
+class FailingBackend(locmem.EmailBackend):
+    """Falha depois de enviar ``limit`` mensagens."""
+
+    def __init__(self, limit, **kwargs):
+        super(FailingBackend, self).__init__(**kwargs)
+        self.limit = limit
+
+    def send_messages(self, messages):
+        if len(mail.outbox) + len(messages) > self.limit:
+            raise SMTPException('conexão perdida')
+        return super(FailingBackend, self).send_messages(messages)
+
+
+class AnnouncementMailTestCase(TestCase):
+    def setUp(self):
+        self.course = mommy.make("courses.Course")
+        mommy.make("courses.Enrollment", course=self.course, status=1,
+                   _quantity=5)
+        mommy.make("courses.Enrollment", course=self.course, status=0)
+
+    def test_announcement_only_enqueues(self):
+        announcement = mommy.make("courses.Announcement", course=self.course)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertTrue(
+            AnnouncementMail.objects.pending().filter(
+                announcement=announcement).exists())
+
+    def test_send_announcements_command(self):
+        mommy.make("courses.Announcement", course=self.course)
+        call_command("send_announcements", chunk_size=2, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(AnnouncementMail.objects.pending().exists())
+        self.assertEqual(AnnouncementMail.objects.get().recipients, 5)
+
+    def test_interrupted_send_resumes(self):
+        mommy.make("courses.Announcement", course=self.course)
+        announcement_mail = AnnouncementMail.objects.get()
+        self.assertTrue(announcement_mail.claim())
+        with self.assertRaises(SMTPException):
+            announcement_mail.send(
+                chunk_size=2, connection=FailingBackend(limit=2))
+        self.assertEqual(len(mail.outbox), 2)
+        # Reserva ainda ativa: outro worker não pega o envio.
+        self.assertFalse(AnnouncementMail.objects.pending().exists())
+
+        announcement_mail.release()
+        call_command("send_announcements", chunk_size=2, stdout=StringIO())
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            sorted(Enrollment.objects.filter(status=1).values_list(
+                'user__email', flat=True)))
+        self.assertEqual(AnnouncementMail.objects.get().recipients, 5)
+
+    def test_expired_claim_is_pending_again(self):
+        mommy.make("courses.Announcement", course=self.course)
+        announcement_mail = AnnouncementMail.objects.get()
+        self.assertTrue(announcement_mail.claim())
+        self.assertFalse(announcement_mail.claim())
+        AnnouncementMail.objects.update(
+            claimed_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertTrue(AnnouncementMail.objects.pending().exists())
+
+
+class ReleaseScheduleTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.today = timezone.now().date()
+        self.course = mommy.make('courses.Course')
+        self.tomorrow = mommy.make(
+            'courses.Lesson', course=self.course,
+            release_date=self.today + datetime.timedelta(days=1))
+        self.in_week = mommy.make(
+            'courses.Lesson', course=self.course,
+            release_date=self.today + datetime.timedelta(days=7))
+        self.past = mommy.make(
+            'courses.Lesson', course=self.course,
+            release_date=self.today - datetime.timedelta(days=1))
+
+    def test_next_transition(self):
+        schedule = ReleaseSchedule.build(
+            [self.tomorrow, self.in_week, self.past], self.today)
+        self.assertEqual(schedule.available,
+                         {self.tomorrow.pk, self.in_week.pk})
+        self.assertEqual(schedule.changes_on,
+                         self.today + datetime.timedelta(days=2))
+
+    def test_cached_until_lesson_changes(self):
+        course = Course.objects.get(pk=self.course.pk)
+        self.assertEqual(len(course.release_lessons()), 2)
+        with self.assertNumQueries(0):
+            self.assertFalse(course.release_schedule().is_available(
+                self.past.pk))
+        self.past.release_date = self.today
+        self.past.save()
+        self.assertEqual(len(course.release_lessons()), 3)
+
+
+class CourseImageRenditionsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        output = BytesIO()
+        Image.new('RGB', (1600, 1000), 'red').save(output, 'PNG')
+        self.course = mommy.make('courses.Course', image=SimpleUploadedFile(
+            'python.png', output.getvalue(), content_type='image/png'))
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def path(self, name):
+        return os.path.join(self.media_root, 'courses', 'images', name)
+
+    def test_renditions_generated_on_upload(self):
+        with Image.open(self.path('python.card.webp')) as image:
+            self.assertEqual(image.size, (400, 250))
+        self.assertTrue(os.path.exists(self.path('python.detail.jpg')))
+
+    def test_template_tag_urls_cached(self):
+        template = Template(
+            "{% load courses_tags %}{% course_image course 'card' %}")
+        html = template.render(Context({'course': self.course}))
+        self.assertIn('/media/courses/images/python.card.webp', html)
+        self.assertIn('/media/courses/images/python.card.jpg', html)
+        os.remove(self.path('python.card.webp'))
+        self.assertEqual(
+            template.render(Context({'course': self.course})), html)
+
+    def test_template_tag_never_resizes(self):
+        os.remove(self.path('python.card.webp'))
+        template = Template(
+            "{% load courses_tags %}{% course_image course 'card' %}")
+        html = template.render(Context({'course': self.course}))
+        self.assertIn('/media/courses/images/python.png', html)
+        self.assertFalse(os.path.exists(self.path('python.card.webp')))
+
+    def test_missing_rendition_cached_until_generated(self):
+        name = self.course.image.name
+        os.remove(self.path('python.card.webp'))
+        cache.clear()
+        self.assertEqual(renditions.get_urls(name, 'card'), {})
+        # Sem consultar o storage de novo enquanto a marca vale.
+        open(self.path('python.card.webp'), 'wb').close()
+        self.assertEqual(renditions.get_urls(name, 'card'), {})
+        renditions.generate(name)
+        self.assertIn('webp', renditions.get_urls(name, 'card'))
+
+    def test_regenerate_overwrites_and_applies_exif(self):
+        output = BytesIO()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: girar 90 graus.
+        Image.new('RGB', (1600, 1000), 'blue').save(
+            output, 'JPEG', exif=exif.tobytes())
+        self.course.image = SimpleUploadedFile(
+            'foto.jpg', output.getvalue(), content_type='image/jpeg')
+        self.course.save()
+        renditions.generate(self.course.image.name)
+        with Image.open(self.path('foto.card.jpg')) as image:
+            self.assertEqual(image.size, (156, 250))
+        self.assertEqual(
+            sorted(name for name in os.listdir(self.path(''))
+                   if name.startswith('foto')),
+            ['foto.card.jpg', 'foto.card.webp', 'foto.detail.jpg',
+             'foto.detail.webp', 'foto.jpg'])
+
+    def test_renditions_deleted_with_course(self):
+        Course.objects.get(pk=self.course.pk).delete()
+        self.assertFalse(os.path.exists(self.path('python.card.webp')))
+        self.assertFalse(os.path.exists(self.path('python.detail.jpg')))
+
+
+class BulkEnrollTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = mommy.make('courses.Course', name='Django')
+        self.users = [
+            mommy.make('accounts.User', username='aluno%d' % i,
+                       email='aluno%d@simplemooc.org' % i)
+            for i in range(3)
+        ]
+        mommy.make('courses.Enrollment', user=self.users[0],
+                   course=self.course, status=0)
+        mommy.make('courses.Enrollment', user=self.users[1],
+                   course=self.course, status=1)
+
+    def test_import_command(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'turma.csv')
+        with open(path, 'w') as csv_file:
+            csv_file.write('username\naluno0\naluno1\n'
+                           'aluno2@simplemooc.org\nninguem\n')
+        out, err = StringIO(), StringIO()
+        try:
+            call_command('import_enrollments', self.course.slug, path,
+                         '--notify', '--chunk-size', '2',
+                         stdout=out, stderr=err)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertIn('1 criada(s), 1 alterada(s), 1 mantida(s).',
+                      out.getvalue())
+        self.assertIn('ninguem', err.getvalue())
+        self.assertEqual(
+            Enrollment.objects.filter(course=self.course, status=1).count(),
+            3)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox),
+                         ['aluno0@simplemooc.org', 'aluno2@simplemooc.org'])
+
+    def test_concurrent_enrollment_retries_chunk(self):
+        # aluno2 se inscreve sozinho depois de o lote ler as inscrições.
+        mommy.make('courses.Enrollment', user=self.users[2],
+                   course=self.course, status=0)
+        stale = {self.users[0].pk: 0, self.users[1].pk: 1}
+        manager = Enrollment.objects
+        statuses = type(manager)._statuses
+        reads = []
+
+        def racing_statuses(course, user_ids):
+            reads.append(user_ids)
+            if len(reads) == 1:
+                return stale
+            return statuses(manager, course, user_ids)
+
+        manager._statuses = racing_statuses
+        try:
+            result = manager.bulk_enroll(
+                self.course, ['aluno0', 'aluno1', 'aluno2'])
+        finally:
+            del manager._statuses
+
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(result[:3], (0, 2, 1))
+        self.assertEqual(
+            Enrollment.objects.filter(course=self.course, status=1).count(),
+            3)
+
+    def test_set_status_clears_cache(self):
+        summaries = Enrollment.objects.refresh_my_courses(self.users[0].pk)
+        self.assertFalse(summaries[0].is_approved())
+        Enrollment.objects.filter(course=self.course).set_status(2)
+        self.assertIsNone(get_my_courses(self.users[0].pk))
+
@@ -0,0 +1,274 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.urlresolvers import reverse
+from django.http import Http404
+from django.test import TestCase, override_settings
+
+from model_mommy import mommy
+
+from simplemooc.courses.decorators import resolve_course_access
+from simplemooc.courses.models import Course
+from simplemooc.courses.templatetags.courses_tags import load_my_courses
+
+
+class EnrollmentRequiredTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make("accounts.User")
+        self.user.set_password("123")
+        self.user.save()
+        self.course = mommy.make("courses.Course", slug="django")
+        self.enrollment = mommy.make(
+            "courses.Enrollment", user=self.user, course=self.course, status=1)
+        self.client.login(username=self.user.username, password="123")
+
+    def test_access_cached_after_first_request(self):
+        course, status = resolve_course_access(self.user, "django")
+        self.assertEqual(course, self.course)
+        self.assertEqual(status, 1)
+        with self.assertNumQueries(0):
+            resolve_course_access(self.user, "django")
+
+    def test_enrollment_change_invalidates_access(self):
+        path = reverse("courses:lessons", args=["django"])
+        self.assertEqual(self.client.get(path).status_code, 200)
+        self.enrollment.status = 0
+        self.enrollment.save()
+        response = self.client.get(path)
+        self.assertRedirects(response, reverse("accounts:dashboard"))
+        self.enrollment.delete()
+        self.assertEqual(resolve_course_access(self.user, "django")[1], None)
+
+    def test_slug_change_invalidates_old_slug(self):
+        resolve_course_access(self.user, "django")
+        self.client.get(reverse("courses:details", args=["django"]))
+        course = Course.objects.get(pk=self.course.pk)
+        course.slug = "django-avancado"
+        course.save()
+        with self.assertRaises(Http404):
+            resolve_course_access(self.user, "django")
+        response = self.client.get(reverse("courses:details", args=["django"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class MyCoursesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make("accounts.User")
+        self.user.set_password("123")
+        self.user.save()
+        self.course = mommy.make("courses.Course", name="Django")
+        mommy.make("courses.Enrollment", user=self.user, course=self.course)
+        self.client.login(username=self.user.username, password="123")
+
+    def test_summary_cached_and_rebuilt(self):
+        enrollments = load_my_courses(self.user)
+        self.assertEqual(str(enrollments[0].course), "Django")
+        with self.assertNumQueries(0):
+            load_my_courses(self.user)
+        self.course.name = "Django Avançado"
+        self.course.save()
+        self.assertEqual(
+            load_my_courses(self.user)[0].course.name, "Django Avançado")
+
+    def test_dashboard_lists_courses(self):
+        response = self.client.get(reverse("accounts:dashboard"))
+        self.assertContains(response, "Django", count=2)
+        self.assertContains(
+            response, reverse("courses:undo_enrollment", args=[self.course.slug]))
+
+
+class CourseContentTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make("accounts.User", is_staff=True)
+        self.user.set_password("123")
+        self.user.save()
+        self.course = mommy.make("courses.Course", slug="django")
+        mommy.make("courses.Enrollment", user=self.user, course=self.course,
+                   status=1)
+        self.lessons = mommy.make(
+            "courses.Lesson", course=self.course, _quantity=3)
+        for lesson in self.lessons:
+            mommy.make("courses.Material", lesson=lesson, embedded="<p/>",
+                       _quantity=2)
+        self.client.login(username=self.user.username, password="123")
+
+    def test_tree_loaded_in_two_queries(self):
+        with self.assertNumQueries(2):
+            content = self.course.content()
+        self.assertEqual(len(content.lessons), 3)
+        self.assertEqual(
+            [len(lesson.materials) for lesson in content.lessons], [2, 2, 2])
+        with self.assertNumQueries(0):
+            self.course.content()
+
+    def test_views_read_from_tree(self):
+        lesson = self.lessons[0]
+        material = mommy.make("courses.Material", lesson=lesson, name="Slides",
+                              embedded="<iframe></iframe>")
+        response = self.client.get(
+            reverse("courses:lesson", args=["django", lesson.pk]))
+        self.assertContains(response, "Slides")
+        response = self.client.get(
+            reverse("courses:material", args=["django", material.pk]))
+        self.assertContains(response, "<iframe></iframe>")
+        url = reverse("courses:material", args=["django", material.pk])
+        material.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+
+class MaterialDownloadTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, SENDFILE_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = mommy.make("accounts.User", is_staff=True)
+        self.user.set_password("123")
+        self.user.save()
+        course = mommy.make("courses.Course", slug="django")
+        mommy.make("courses.Enrollment", user=self.user, course=course,
+                   status=1)
+        self.lesson = mommy.make("courses.Lesson", course=course)
+        material = mommy.make("courses.Material", lesson=self.lesson,
+                              embedded="")
+        material.file.save("aula.pdf", ContentFile(b"0123456789"))
+        self.url = reverse("courses:material_download",
+                           args=["django", material.pk])
+        self.client.login(username=self.user.username, password="123")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_range_and_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, 416)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_front_server_headers(self):
+        with self.settings(SENDFILE_BACKEND="nginx"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"],
+                         "/protected/lessons/materials/aula.pdf")
+        self.assertEqual(response.content, b"")
+
+    def test_compressed_file_sent_as_is(self):
+        material = mommy.make("courses.Material", lesson=self.lesson,
+                              embedded="")
+        material.file.save("codigo.tar.gz", ContentFile(b"\x1f\x8b"))
+        response = self.client.get(reverse(
+            "courses:material_download", args=["django", material.pk]))
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.course = mommy.make("courses.Course", name="Django", slug="django")
+
+    def test_catalog_cached_and_conditional(self):
+        url = reverse("courses:index")
+        response = self.client.get(url)
+        self.assertContains(response, "Django")
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url)["ETag"], etag)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        mommy.make("courses.Lesson", course=self.course)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_deleted_course_changes_catalog_etag(self):
+        url = reverse("courses:index")
+        response = self.client.get(url)
+        self.assertFalse(response.has_header("Last-Modified"))
+        etag = response["ETag"]
+        self.course.delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Django")
+
+    @override_settings(PAGE_CACHE_URL_NAMES=())
+    def test_details_etag_follows_csrf_token(self):
+        url = reverse("courses:details", args=["django"])
+        self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Login e logout trocam o token do formulário de contato.
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "outro" * 8
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_cached_details_page_has_no_validators(self):
+        url = reverse("courses:details", args=["django"])
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual(response["X-Page-Cache"], "hit")
+        self.assertFalse(response.has_header("ETag"))
+        self.assertFalse(response.has_header("Last-Modified"))
+
+
+class AnnouncementsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = mommy.make("accounts.User")
+        self.user.set_password("123")
+        self.user.save()
+        self.course = mommy.make("courses.Course", slug="django")
+        mommy.make("courses.Enrollment", user=self.user, course=self.course,
+                   status=1)
+        self.announcements = mommy.make(
+            "courses.Announcement", course=self.course, _quantity=5)
+        for announcement in self.announcements:
+            for user in mommy.make("accounts.User", _quantity=3):
+                mommy.make("courses.Comment", announcement=announcement,
+                           user=user)
+        self.client.login(username=self.user.username, password="123")
+
+    def test_feed_query_count(self):
+        url = reverse("courses:announcements", args=["django"])
+        self.client.get(url)
+        # Sessão, usuário, feed e acesso ao curso vêm do cache.
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, "3\n                    Comentários",
+                            count=5)
+
+        mommy.make("courses.Comment", announcement=self.announcements[0],
+                   user=self.user)
+        response = self.client.get(url)
+        self.assertContains(response, "4\n                    Comentários")
+
+    def test_comments_with_users_in_one_query(self):
+        url = reverse("courses:show_announcement",
+                      args=["django", self.announcements[0].pk])
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context["comments"]), 3)
@@ -20,4 +20,6 @@ urlpatterns = [
         views.lesson, name='lesson'),
     url(r'^(?P<slug>[\w_-]+)/materiais/(?P<pk>\d+)/$',
         views.material, name='material'),
+    url(r'^(?P<slug>[\w_-]+)/materiais/(?P<pk>\d+)/download/$',
+        views.material_download, name='material_download'),
 ]
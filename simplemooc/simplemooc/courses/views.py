@@ -1,17 +1,62 @@
+import hashlib
+import os
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
+
+from simplemooc.core.sendfile import sendfile
 
+from .cache import catalog_version, load_catalog, load_course
 from .decorators import enrollment_required
 from .forms import CommentForm, ContactCourse
-from .models import Announcement, Course, Enrollment, Lesson, Material
+from .models import Announcement, Course, Enrollment
+
+
+def catalog():
+    """``(versão, cursos)`` da listagem, só com as colunas exibidas."""
+    version = catalog_version()
+    courses = load_catalog(version, lambda: list(Course.objects.only(
+        'name', 'slug', 'description', 'image', 'update_at')))
+    return version, courses
+
+
+def get_course_by_slug(slug):
+    return load_course(slug, lambda: get_object_or_404(Course, slug=slug))
+
+
+# O menu muda com o login, então o ETag também depende do usuário.
+def catalog_etag(request):
+    return '%s-%s' % (catalog_version(), request.user.pk or 0)
+
+
+def csrf_fingerprint(request):
+    token = request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')
+    return hashlib.md5(token.encode('utf-8')).hexdigest()[:12]
+
+
+# A página tem o formulário de contato, com o token do CSRF que muda no
+# login e no logout: uma cópia com o token antigo não pode receber 304.
+# Sem Last-Modified, que sozinho validaria essa cópia.
+def details_etag(request, slug):
+    return '%s-%s-%s-%s' % (catalog_version(), slug, request.user.pk or 0,
+                            csrf_fingerprint(request))
 
 
+# Só o ETag: a maior data de alteração volta no tempo quando um curso é
+# excluído e um Last-Modified baseado nela validaria a cópia antiga.
+@condition(etag_func=catalog_etag)
 def index(request):
-    courses = Course.objects.all()
+    version, courses = catalog()
     template_name = 'courses/index.html'
     context = {
-        'courses': courses
+        'courses': courses,
+        'catalog_version': version,
+        'catalog_timeout': settings.COURSES_CATALOG_CACHE_TIMEOUT,
     }
     return render(request, template_name, context)
 
@@ -25,8 +70,9 @@ def index(request):
 
 #     return render(request, template_name, context)
 
+@condition(etag_func=details_etag)
 def details(request, slug):
-    course = get_object_or_404(Course, slug=slug)
+    course = get_course_by_slug(slug)
     context = {}
 
     if request.method == 'POST':
@@ -88,7 +134,7 @@ def announcements(request, slug):
     template = 'courses/announcements.html'
     context = {
         'course': course,
-        'announcements': course.announcements.all()
+        'announcements': Announcement.objects.feed(course.pk)
     }
     return render(request, template, context)
 
@@ -98,7 +144,11 @@ def announcements(request, slug):
 def show_announcement(request, slug, pk):
     course = request.course
 
-    announcement = get_object_or_404(course.announcements.all(), pk=pk)
+    for announcement in Announcement.objects.feed(course.pk):
+        if announcement.pk == int(pk):
+            break
+    else:
+        raise Http404('Anúncio não encontrado.')
     form = CommentForm(request.POST or None)
 
     if form.is_valid():
@@ -114,6 +164,7 @@ def show_announcement(request, slug, pk):
     context = {
         'course': course,
         'announcement': announcement,
+        'comments': announcement.comments.select_related('user'),
         'form': form,
     }
 
@@ -124,10 +175,11 @@ def show_announcement(request, slug, pk):
 @enrollment_required
 def lessons(request, slug):
     course = request.course
-    lessons = course.release_lessons()
+    schedule = course.release_schedule()
+    lessons = schedule.available_lessons()
 
     if request.user.is_staff:
-        lessons = course.lessons.all()
+        lessons = schedule.lessons
 
     template = 'courses/lessons.html'
     context = {
@@ -142,9 +194,12 @@ def lessons(request, slug):
 @enrollment_required
 def lesson(request, slug, pk):
     course = request.course
-    lesson = get_object_or_404(Lesson, pk=pk, course=course)
+    schedule = course.release_schedule()
+    lesson = course.content().get_lesson(int(pk))
+    if lesson is None:
+        raise Http404('Aula não encontrada.')
 
-    if not request.user.is_staff and not lesson.is_available():
+    if not request.user.is_staff and not schedule.is_available(lesson.pk):
         messages.error(request, 'Esta aula não está disponivel')
         return redirect('courses:lessons', slug=course.slug)
 
@@ -157,19 +212,35 @@ def lesson(request, slug, pk):
     return render(request, template, context)
 
 
+def _get_material(request, pk):
+    """``(lesson, material, response)``; ``response`` é o redirecionamento
+    quando a aula ainda não está disponível para o usuário."""
+    course = request.course
+    content = course.content()
+    material = content.get_material(int(pk))
+    if material is None:
+        raise Http404('Material não encontrado.')
+    lesson = content.get_lesson(material.lesson_id)
+
+    response = None
+    if not request.user.is_staff and \
+            not course.release_schedule().is_available(lesson.pk):
+        messages.error(request, 'Este material não está disponivel')
+        response = redirect('courses:lesson', slug=course.slug, pk=lesson.pk)
+    return lesson, material, response
+
+
 @login_required
 @enrollment_required
 def material(request, slug, pk):
     course = request.course
-    material = get_object_or_404(Material, pk=pk, lesson__course=course)
-    lesson = material.lesson
-
-    if not request.user.is_staff and not lesson.is_available():
-        messages.error(request, 'Este material não está disponivel')
-        return redirect('courses:lesson', slug=course.slug, pk=lesson.pk)
+    lesson, material, response = _get_material(request, pk)
+    if response is not None:
+        return response
 
     if not material.is_embedded():
-        return redirect(material.file.url)
+        return redirect(
+            'courses:material_download', slug=course.slug, pk=material.pk)
 
     template = 'courses/material.html'
     context = {
@@ -179,3 +250,22 @@ def material(request, slug, pk):
     }
 
     return render(request, template, context)
+
+
+@login_required
+@enrollment_required
+def material_download(request, slug, pk):
+    lesson, material, response = _get_material(request, pk)
+    if response is not None:
+        return response
+    if not material.file_name:
+        raise Http404('Material sem arquivo.')
+
+    try:
+        path = default_storage.path(material.file_name)
+    except NotImplementedError:
+        # Storage remoto (S3 etc.): o próprio storage controla o acesso.
+        return redirect(default_storage.url(material.file_name))
+    if not os.path.isfile(path):
+        raise Http404('Arquivo não encontrado.')
+    return sendfile(request, path, os.path.basename(material.file_name))
@@ -0,0 +1,41 @@
+from django.core.cache import cache
+
+from simplemooc.core.cache import bump_version
+from simplemooc.core.pagecache import invalidate_pages
+
+TAGS_VERSION_KEY = 'forum:tags:version'
+
+
+def thread_version_key(thread_id):
+    return 'forum:thread:%s:version' % thread_id
+
+
+def get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            versions[key] = bump_version(key, cache)
+    return [versions[key] for key in keys]
+
+
+def fragment_versions(thread_id=None):
+    """Versões usadas nas chaves dos fragmentos do fórum em cache."""
+    if thread_id is None:
+        tags_version, = get_versions(TAGS_VERSION_KEY)
+        return {'tags_version': tags_version}
+    thread_version, tags_version = get_versions(
+        thread_version_key(thread_id), TAGS_VERSION_KEY)
+    return {'thread_version': thread_version, 'tags_version': tags_version}
+
+
+# Qualquer mudança que invalida os fragmentos do fórum também muda as
+# páginas guardadas para os visitantes anônimos.
+
+def invalidate_thread(thread_id):
+    bump_version(thread_version_key(thread_id), cache)
+    invalidate_pages('forum')
+
+
+def invalidate_tags():
+    bump_version(TAGS_VERSION_KEY, cache)
+    invalidate_pages('forum')
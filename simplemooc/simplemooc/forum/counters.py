@@ -0,0 +1,93 @@
+import atexit
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import F
+
+from simplemooc.core.db import background_writes
+from simplemooc.core.pagecache import page_served
+
+from .models import Thread
+
+
+class ViewCounter(object):
+    """Acumula incrementos de um campo inteiro em memória e grava em lote.
+
+    Cada ``flush`` agrupa os objetos pelo número de acessos acumulados e
+    executa um ``UPDATE ... SET campo = campo + n`` por grupo, sem passar
+    pelo ``save()`` do modelo (não altera ``auto_now`` nem sobrescreve as
+    outras colunas).
+    """
+
+    def __init__(self, model, field, flush_interval=30, flush_threshold=100):
+        self.model = model
+        self.field = field
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._total = 0
+        self._last_flush = time.monotonic()
+
+    def hit(self, pk, count=1):
+        with self._lock:
+            self._pending[pk] += count
+            self._total += count
+            due = self._total >= self.flush_threshold or \
+                time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def pending(self, pk):
+        with self._lock:
+            return self._pending.get(pk, 0)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._total = 0
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        groups = defaultdict(list)
+        for pk, count in pending.items():
+            groups[count].append(pk)
+
+        try:
+            # Quem fez a requisição que disparou o flush não pediu escrita
+            # nenhuma e continua lendo das réplicas.
+            with background_writes():
+                for count, pks in groups.items():
+                    self.model.objects.filter(pk__in=pks).update(
+                        **{self.field: F(self.field) + count})
+        except Exception:
+            # Devolve os acessos ao buffer para a próxima tentativa.
+            with self._lock:
+                self._pending.update(pending)
+                self._total += sum(pending.values())
+            raise
+
+        return sum(pending.values())
+
+
+thread_views = ViewCounter(
+    Thread, 'views',
+    flush_interval=settings.FORUM_VIEWS_FLUSH_INTERVAL,
+    flush_threshold=settings.FORUM_VIEWS_FLUSH_THRESHOLD,
+)
+
+atexit.register(thread_views.flush)
+
+
+def count_cached_thread_view(url_name, data, **kwargs):
+    # Tópico entregue pelo cache de páginas: a view não rodou.
+    if url_name == 'forum:thread' and data:
+        thread_views.hit(data['thread_id'])
+
+
+page_served.connect(
+    count_cached_thread_view, dispatch_uid='count_cached_thread_view')
@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F
+
+from simplemooc.forum.models import Thread
+
+
+class Command(BaseCommand):
+    help = 'Corrige o número de respostas dos tópicos que divergem do banco.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Quantidade de tópicos por UPDATE.'
+        )
+
+    def handle(self, *args, **options):
+        drifted = Thread.objects.order_by().annotate(
+            total=Count('replies')
+        ).exclude(answers=F('total')).values_list('pk', 'total')
+
+        groups = defaultdict(list)
+        for pk, total in drifted:
+            groups[total].append(pk)
+
+        chunk_size = options['chunk_size']
+        fixed = 0
+        for total, pks in groups.items():
+            for start in range(0, len(pks), chunk_size):
+                fixed += Thread.objects.filter(
+                    pk__in=pks[start:start + chunk_size]
+                ).update(answers=total)
+
+        self.stdout.write('%d tópico(s) corrigido(s).' % fixed)
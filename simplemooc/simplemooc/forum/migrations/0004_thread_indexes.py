@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 14:36
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0003_thread_slug'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['modified', 'id'],
+                               name='forum_threa_modifie_da7e21_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['views', 'id'],
+                               name='forum_threa_views_ec91b9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['answers', 'id'],
+                               name='forum_threa_answers_8b0a1b_idx'),
+        ),
+    ]
@@ -1,6 +1,13 @@
+import datetime
+
 from django.conf import settings
 from django.db import models
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+
+from simplemooc.core import search
+
+from .cache import invalidate_tags, invalidate_thread
 
 
 class Thread(models.Model):
@@ -33,6 +40,13 @@ class Thread(models.Model):
         verbose_name = 'Tópico'
         verbose_name_plural = 'Tópicos'
         ordering = ['-modified']
+        indexes = [
+            # Ordenações do índice do fórum, com o id como desempate da
+            # paginação por cursor (ORDER BY campo DESC, id DESC).
+            models.Index(fields=['modified', 'id']),
+            models.Index(fields=['views', 'id']),
+            models.Index(fields=['answers', 'id']),
+        ]
 
 class Reply(models.Model):
 
@@ -50,29 +64,77 @@ class Reply(models.Model):
     created = models.DateField('Criado em', auto_now_add=True)
     modified = models.DateField('Modificado em', auto_now=True)        
 
+    def __init__(self, *args, **kwargs):
+        super(Reply, self).__init__(*args, **kwargs)
+        # Valor de ``correct`` no banco, para saber quando ele muda.
+        self._saved_correct = self.__dict__.get('correct')
+
     def __str__(self):
         return self.reply[:100]
 
+    def get_absolute_url(self):
+        return '%s#comments' % self.thread.get_absolute_url()
+
     class Meta:
         verbose_name = 'Resposta'
         verbose_name_plural = 'Respostas'
         ordering = ['-correct', 'created']
 
 def post_save_reply(created, instance, **kwargs):
-    instance.thread.answers = instance.thread.replies.count()
-    instance.thread.save()
-    if instance.correct:
-        instance.thread.replies.exclude(pk=instance.pk).update(
-            correct=False
+    if created:
+        Thread.objects.filter(pk=instance.thread_id).update(
+            answers=models.F('answers') + 1, modified=datetime.date.today()
         )
+    if instance.correct and (created or not instance._saved_correct):
+        Reply.objects.filter(
+            thread_id=instance.thread_id, correct=True
+        ).exclude(pk=instance.pk).update(correct=False)
+    instance._saved_correct = instance.correct
+    invalidate_thread(instance.thread_id)
 
 def post_delete_reply(instance, **kwargs):
-    instance.thread.answers = instance.thread.replies.count()
-    instance.thread.save()
+    Thread.objects.filter(pk=instance.thread_id).update(
+        answers=models.F('answers') - 1
+    )
+    invalidate_thread(instance.thread_id)
+
+def post_save_thread(instance, **kwargs):
+    invalidate_thread(instance.pk)
+
+def post_delete_thread(instance, **kwargs):
+    invalidate_thread(instance.pk)
+    invalidate_tags()
+
+def thread_tags_changed(instance, action, **kwargs):
+    if isinstance(instance, Thread) and action.startswith('post_'):
+        invalidate_thread(instance.pk)
+        invalidate_tags()
+
+def tag_changed(**kwargs):
+    invalidate_tags()
     
 models.signals.post_save.connect(
     post_save_reply, sender=Reply, dispatch_uid='post_save_reply'
 )
 models.signals.post_delete.connect(
     post_delete_reply, sender=Reply, dispatch_uid='post_delete_reply'
-)
\ No newline at end of file
+)
+models.signals.post_save.connect(
+    post_save_thread, sender=Thread, dispatch_uid='post_save_thread'
+)
+models.signals.post_delete.connect(
+    post_delete_thread, sender=Thread, dispatch_uid='post_delete_thread'
+)
+models.signals.m2m_changed.connect(
+    thread_tags_changed, sender=Thread.tags.through,
+    dispatch_uid='thread_tags_changed'
+)
+models.signals.post_save.connect(
+    tag_changed, sender=Tag, dispatch_uid='post_save_tag'
+)
+models.signals.post_delete.connect(
+    tag_changed, sender=Tag, dispatch_uid='post_delete_tag'
+)
+
+search.register(Thread, title='title', body=('body',))
+search.register(Reply, body=('reply',), related=('thread',))
@@ -0,0 +1,104 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(object):
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator(object):
+    """Paginação por chave (keyset) em ordem decrescente de ``field``.
+
+    O cursor guarda o valor de ``field`` e o ``pk`` do último item visto,
+    então cada página é uma consulta ``WHERE (field, pk) < (valor, pk)
+    LIMIT n`` sem ``OFFSET`` e sem ``COUNT(*)``.
+    """
+
+    def __init__(self, queryset, field, per_page):
+        self.queryset = queryset
+        self.field = field
+        self.per_page = per_page
+        self.model_field = queryset.model._meta.get_field(field)
+
+    def encode_cursor(self, obj, backwards=False):
+        value = self.model_field.value_to_string(obj)
+        data = json.dumps([self.field, value, obj.pk, backwards])
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+            field, value, pk, backwards = json.loads(data.decode('utf-8'))
+            if field != self.field:
+                raise InvalidCursor(cursor)
+            return self.model_field.to_python(value), int(pk), bool(backwards)
+        except (ValueError, TypeError, binascii.Error, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def page(self, cursor=None):
+        field = self.field
+        queryset = self.queryset.order_by('-%s' % field, '-pk')
+        backwards = False
+
+        if cursor:
+            value, pk, backwards = self.decode_cursor(cursor)
+            if backwards:
+                queryset = self.queryset.filter(
+                    Q(**{'%s__gt' % field: value}) |
+                    Q(**{field: value, 'pk__gt': pk})
+                ).order_by(field, 'pk')
+            else:
+                queryset = queryset.filter(
+                    Q(**{'%s__lt' % field: value}) |
+                    Q(**{field: value, 'pk__lt': pk})
+                )
+
+        # Um item a mais indica se existe outra página nesse sentido.
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if backwards:
+            object_list.reverse()
+
+        if not object_list:
+            return CursorPage(object_list)
+
+        if backwards:
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(cursor)
+
+        return CursorPage(
+            object_list,
+            next_cursor=self.encode_cursor(object_list[-1])
+            if has_next else None,
+            previous_cursor=self.encode_cursor(object_list[0], True)
+            if has_previous else None,
+        )
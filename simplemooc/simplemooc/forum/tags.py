@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db.models import Count
+from taggit.models import Tag, TaggedItem
+
+from simplemooc.core.db import read_from_primary
+
+from .cache import TAGS_VERSION_KEY, get_versions
+from .models import Thread
+
+TAGS_TIMEOUT = 60 * 60 * 24
+
+# Guardado quando o slug não corresponde a nenhuma tag.
+MISSING_TAG = 0
+
+
+class TagCount(namedtuple('TagCount', 'slug name threads')):
+    __slots__ = ()
+
+    def __str__(self):
+        return self.name
+
+
+def _key(name, tags_version):
+    # As chaves levam a versão das tags: qualquer alteração de tag (que já
+    # invalida os fragmentos do fórum) também descarta estes valores.
+    return 'forum:tags:%s:%s' % (tags_version, name)
+
+
+def get_tag_id(slug):
+    tags_version, = get_versions(TAGS_VERSION_KEY)
+    key = _key('slug:%s' % slug, tags_version)
+    tag_id = cache.get(key)
+    if tag_id is None:
+        with read_from_primary():
+            tag_id = Tag.objects.filter(slug=slug).values_list(
+                'pk', flat=True).first() or MISSING_TAG
+        cache.set(key, tag_id, TAGS_TIMEOUT)
+    return tag_id or None
+
+
+def filter_by_tag(queryset, slug):
+    """Filtra os tópicos com a tag ``slug`` por igualdade do ``tag_id``."""
+    tag_id = get_tag_id(slug)
+    if tag_id is None:
+        return queryset.none()
+    return queryset.filter(tags=tag_id)
+
+
+def tag_counts():
+    """Tabela ``(slug, name, threads)`` das tags usadas nos tópicos."""
+    tags_version, = get_versions(TAGS_VERSION_KEY)
+    key = _key('counts', tags_version)
+    counts = cache.get(key)
+    if counts is None:
+        with read_from_primary():
+            rows = TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(Thread)
+            ).values_list('tag__slug', 'tag__name').annotate(
+                threads=Count('object_id')
+            ).order_by('tag__name')
+            counts = [TagCount(*row) for row in rows]
+        cache.set(key, counts, TAGS_TIMEOUT)
+    return counts
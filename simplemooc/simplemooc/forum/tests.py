@@ -1,3 +1,181 @@
-from django.test import TestCase
+import datetime
+import threading
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from model_mommy import mommy
+
+from simplemooc.forum.counters import ViewCounter, thread_views
+from simplemooc.forum.models import Reply, Thread
+from simplemooc.forum.tags import tag_counts
+
+
+class ViewCounterTestCase(TestCase):
+    def setUp(self):
+        self.threads = mommy.make("forum.Thread", _quantity=3)
+        self.yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        Thread.objects.update(modified=self.yesterday)
+
+    def test_concurrent_hits_are_not_lost(self):
+        counter = ViewCounter(Thread, "views", flush_interval=3600,
+                              flush_threshold=10 ** 9)
+        readers, hits = 300, 20
+
+        def read(thread):
+            for _ in range(hits):
+                counter.hit(thread.pk)
+
+        workers = [
+            threading.Thread(target=read, args=(self.threads[i % 3],))
+            for i in range(readers)
+        ]
+        for worker in workers:
+            worker.start()
+        # Grava em lote enquanto os leitores ainda estão incrementando.
+        while any(worker.is_alive() for worker in workers):
+            counter.flush()
+        for worker in workers:
+            worker.join()
+        counter.flush()
+
+        views = Thread.objects.values_list("views", flat=True)
+        self.assertEqual(sum(views), readers * hits)
+        self.assertEqual(
+            set(Thread.objects.values_list("modified", flat=True)),
+            {self.yesterday})
+
+
+class ReplyCountersTestCase(TestCase):
+    def setUp(self):
+        self.thread = mommy.make("forum.Thread")
+        self.replies = mommy.make(
+            "forum.Reply", thread=self.thread, correct=False, _quantity=3)
+
+    def answers(self):
+        return Thread.objects.get(pk=self.thread.pk).answers
+
+    def test_counter_follows_create_and_delete(self):
+        self.assertEqual(self.answers(), 3)
+        self.replies[0].delete()
+        self.assertEqual(self.answers(), 2)
+
+    def test_only_one_correct_reply(self):
+        first, second = self.replies[:2]
+        first.correct = True
+        first.save()
+        second.correct = True
+        second.save()
+        self.assertEqual(
+            list(Reply.objects.filter(correct=True)), [second])
+
+    def test_reconcile_command(self):
+        Thread.objects.update(answers=42)
+        call_command("reconcile_thread_answers", stdout=StringIO())
+        self.assertEqual(self.answers(), 3)
+
+
+class ThreadViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.thread = mommy.make("forum.Thread", slug="duvida")
+        self.thread.tags.add("django")
+        mommy.make("forum.Reply", thread=self.thread, _quantity=30)
+        self.url = self.thread.get_absolute_url()
+
+    def tearDown(self):
+        # Grava as visualizações pendentes ainda no banco de testes.
+        thread_views.flush()
+
+    @override_settings(PAGE_CACHE_URL_NAMES=())
+    def test_replies_rendered_in_constant_queries(self):
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_new_reply_invalidates_fragment(self):
+        self.client.get(self.url)
+        mommy.make("forum.Reply", thread=self.thread, reply="Resposta nova")
+        self.assertContains(self.client.get(self.url), "Resposta nova")
+
+    def test_replies_in_a_row_invalidate_fragment(self):
+        for number in range(20):
+            mommy.make("forum.Reply", thread=self.thread,
+                       reply="Resposta %s" % number)
+            self.assertContains(
+                self.client.get(self.url), "Resposta %s" % number)
+
+    def test_reply_time_not_frozen_in_fragment(self):
+        reply = Reply.objects.filter(thread=self.thread).first()
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertContains(
+            response, 'datetime="%s"' % reply.created.isoformat())
+        self.assertNotContains(response, "atrás")
+
+    def test_new_tag_invalidates_fragment(self):
+        self.client.get(self.url)
+        self.thread.tags.add("python")
+        self.assertContains(
+            self.client.get(self.url), "/forum/tag/python/", count=2)
+
+
+class ForumPaginationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        mommy.make("forum.Thread", _quantity=5)
+        Thread.objects.update(modified=datetime.date.today())
+        for views, thread in enumerate(Thread.objects.order_by("pk")):
+            Thread.objects.filter(pk=thread.pk).update(views=views % 2)
+
+    def walk(self, order):
+        url, seen = "/forum/?order=%s" % order, []
+        while url:
+            response = self.client.get(url)
+            page = response.context["page_obj"]
+            seen.extend(thread.pk for thread in page.object_list)
+            url = "/forum/?order=%s&cursor=%s" % (order, page.next_cursor) \
+                if page.has_next() else None
+        return seen, page
+
+    def test_cursor_pages_follow_ordering(self):
+        for order, field in (("", "modified"), ("views", "views")):
+            seen, last_page = self.walk(order)
+            expected = list(Thread.objects.order_by(
+                "-" + field, "-pk").values_list("pk", flat=True))
+            self.assertEqual(seen, expected)
+            previous = self.client.get("/forum/?order=%s&cursor=%s" % (
+                order, last_page.previous_cursor))
+            self.assertEqual(
+                [t.pk for t in previous.context["page_obj"].object_list],
+                expected[2:4])
+
+    def test_offset_fallback_and_invalid_cursor(self):
+        response = self.client.get("/forum/?page=2")
+        self.assertEqual(response.context["page_obj"].number, 2)
+        self.assertEqual(self.client.get("/forum/?cursor=xx").status_code, 404)
+
+
+class TagFilterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.django = mommy.make("forum.Thread")
+        self.django.tags.add("django", "python")
+        self.rest = mommy.make("forum.Thread")
+        self.rest.tags.add("django-rest")
+
+    def test_exact_tag_filter(self):
+        response = self.client.get("/forum/tag/django/")
+        self.assertEqual(list(response.context["object_list"]), [self.django])
+        response = self.client.get("/forum/tag/nao-existe/")
+        self.assertEqual(list(response.context["object_list"]), [])
+
+    def test_tag_counts(self):
+        self.assertEqual(
+            [(tag.slug, tag.threads) for tag in tag_counts()],
+            [("django", 1), ("django-rest", 1), ("python", 1)])
+        self.rest.tags.add("python")
+        self.assertEqual(tag_counts()[-1].threads, 2)
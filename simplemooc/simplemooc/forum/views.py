@@ -1,12 +1,18 @@
 import json
 
+from django.conf import settings
 from django.contrib import messages
-from django.http import HttpResponse
+from django.db import DEFAULT_DB_ALIAS
+from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.views.generic import DetailView, ListView, TemplateView, View
 
+from .cache import fragment_versions
+from .counters import thread_views
 from .forms import ReplyForm
 from .models import Reply, Thread
+from .pagination import CursorPaginator, InvalidCursor
+from .tags import filter_by_tag, tag_counts
 
 # Implementação mantida da aula 77. para referencia
 # class ForumView(TemplateView):
@@ -16,10 +22,17 @@ from .models import Reply, Thread
 class ForumView(ListView):
     paginate_by = 2
     template_name = 'forum/index.html'
+    # Paginação por cursor; links antigos com ?page= continuam usando o
+    # Paginator com OFFSET.
+    cursor_pagination = True
+    cursor_fields = {'': 'modified', 'views': 'views', 'answers': 'answers'}
 
     def get_context_data(self, **kwargs):
         context = super(ForumView, self).get_context_data(**kwargs)
-        context["tags"] = Thread.tags.all()
+        # Chamado pelo template só quando o fragmento não está no cache.
+        context["tags"] = tag_counts
+        context['fragment_timeout'] = settings.FORUM_FRAGMENT_CACHE_TIMEOUT
+        context.update(fragment_versions())
         return context
 
     def get_queryset(self):
@@ -34,27 +47,52 @@ class ForumView(ListView):
         tag = self.kwargs.get('tag', '')
 
         if tag:
-            queryset = queryset.filter(tags__slug__icontains=tag)
+            queryset = filter_by_tag(queryset, tag)
 
         return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        order = self.request.GET.get('order', '')
+        if not self.cursor_pagination or order not in self.cursor_fields or \
+                self.page_kwarg in self.request.GET:
+            return super(ForumView, self).paginate_queryset(
+                queryset, page_size)
+
+        paginator = CursorPaginator(
+            queryset, self.cursor_fields[order], page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404('Cursor inválido.')
+        return (None, page, page.object_list, page.has_other_pages())
     
 
 class ThreadView(DetailView):
     model = Thread
+    queryset = Thread.objects.select_related('author')
     template_name = 'forum/thread.html'
 
     def get(self, request, *args, **kwargs):
         response = super(ThreadView, self).get(request, *args, **kwargs)
         if not self.request.user.is_authenticated() or \
-            (self.object.author != self.request.user):
-            self.object.views = self.object.views + 1
-            self.object.save()
+            (self.object.author_id != self.request.user.pk):
+            thread_views.hit(self.object.pk)
+        # Para o cache de páginas contar as visualizações dos anônimos.
+        response.page_cache_data = {'thread_id': self.object.pk}
         return response
 
     def get_context_data(self, **kwargs):
         context = super(ThreadView, self).get_context_data(**kwargs)
-        context["tags"] = Thread.tags.all()
+        # Querysets preguiçosos: só são executados quando o fragmento
+        # correspondente não está no cache.
+        context["tags"] = tag_counts
+        # Lidas do banco principal: vão para o fragmento em cache.
+        context['replies'] = self.object.replies.select_related(
+            'author').using(DEFAULT_DB_ALIAS)
+        context['is_author'] = self.object.author_id == self.request.user.pk
         context['form'] = ReplyForm(self.request.POST or None)
+        context['fragment_timeout'] = settings.FORUM_FRAGMENT_CACHE_TIMEOUT
+        context.update(fragment_versions(self.object.pk))
         return context
 
     def post(self, request, *args, **kwargs):
@@ -71,6 +109,7 @@ class ThreadView(DetailView):
             reply.save()
             messages.success(self.request, 'A sua resposta foi enviada com sucesso.')
             context['form'] = ReplyForm()
+            context.update(fragment_versions(self.object.pk))
         return self.render_to_response(context)
     
 class ReplyCorrectView(View):
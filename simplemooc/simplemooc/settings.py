@@ -45,20 +45,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'simplemooc.core.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'simplemooc.core.db.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'simplemooc.core.pagecache.AnonymousPageCacheMiddleware',
 ]
 
 ROOT_URLCONF = 'simplemooc.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'simplemooc.core.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -85,6 +88,55 @@ DATABASES = {
     }
 }
 
+# Réplicas de leitura (simplemooc.core.db.ReplicaRouter): aliases de
+# DATABASES para onde vão as leituras dos apps em DATABASE_REPLICA_APPS.
+# Para testar localmente com arquivos SQLite, copie o db.sqlite3 e rode
+#   SIMPLEMOOC_REPLICAS=replica1.sqlite3,replica2.sqlite3 python manage.py runserver
+# Com PostgreSQL, declare cada réplica em DATABASES com 'TEST': {'MIRROR':
+# 'default'} e liste os aliases em DATABASE_REPLICAS.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(
+        filter(None, os.environ.get('SIMPLEMOOC_REPLICAS', '').split(',')), 1):
+    DATABASES['replica%d' % _index] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, _name),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append('replica%d' % _index)
+
+DATABASE_REPLICA_APPS = ('accounts', 'courses', 'forum')
+DATABASE_ROUTERS = ['simplemooc.core.db.ReplicaRouter']
+# Segundos em que o navegador continua lendo do banco principal depois de
+# uma escrita (PrimaryPinMiddleware).
+DATABASE_STICKY_SECONDS = 10
+
+
+# Cache em duas camadas (simplemooc.core.cache.TieredCache): memória do
+# processo na frente do cache compartilhado 'shared'. Em produção troque o
+# 'shared' por memcached/Redis; SIMPLEMOOC_CACHE_DIR muda a pasta do cache
+# em arquivos. A pasta guarda sessões e é lida com pickle: nunca use um
+# diretório compartilhado como o /tmp (o Django a cria com permissão 0700).
+CACHES = {
+    'default': {
+        'BACKEND': 'simplemooc.core.cache.TieredCache',
+        'LOCATION': 'shared',
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'SIMPLEMOOC_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Os testes usam uma pasta de cache própria, vazia a cada execução.
+TEST_RUNNER = 'simplemooc.core.runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -138,9 +190,112 @@ EMAIL_HOST_PASSWORD = 'senha'
 
 CONTACT_EMAIL = 'contato@simplemooc.com'
 
+# Quantidade de mensagens por lote no envio dos e-mails de anúncios
+# (python manage.py send_announcements)
+ANNOUNCEMENT_MAIL_CHUNK_SIZE = 200
+# Segundos sem progresso até outro worker assumir um envio interrompido.
+ANNOUNCEMENT_MAIL_LEASE = 15 * 60
+
+# Visualizações dos tópicos do fórum ficam em memória e são gravadas no banco
+# a cada FORUM_VIEWS_FLUSH_INTERVAL segundos ou FORUM_VIEWS_FLUSH_THRESHOLD
+# acessos, o que ocorrer primeiro.
+FORUM_VIEWS_FLUSH_INTERVAL = 30
+FORUM_VIEWS_FLUSH_THRESHOLD = 100
+
+# Tempo máximo dos fragmentos do fórum em cache (respostas e tags); eles
+# também são invalidados pelos sinais de Reply e das tags.
+FORUM_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Listagem de cursos em cache; a versão do catálogo muda a cada alteração
+# de um curso ou aula, então este é só o tempo máximo.
+COURSES_CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Consultas a partir deste tempo vão para o log simplemooc.slow_queries com
+# a view que as fez (simplemooc.core.metrics.RequestMetricsMiddleware).
+SLOW_QUERY_THRESHOLD_MS = 100
+
+# O cabeçalho Server-Timing sai com DEBUG e para a equipe; True o envia em
+# todas as respostas (usado pelo benchmark_routes).
+SERVER_TIMING_PUBLIC = False
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'simplemooc.slow_queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+
+# Páginas inteiras em cache para visitantes anônimos
+# (simplemooc.core.pagecache). Os sinais de Course, Thread e Reply
+# invalidam as páginas do app; este é só o tempo máximo.
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGE_CACHE_URL_NAMES = (
+    'core:home',
+    'core:contact',
+    'courses:index',
+    'courses:details',
+    'forum:index',
+    'forum:index_tagged',
+    'forum:thread',
+)
+# Parâmetros que fazem parte da chave; com qualquer outro a página não
+# usa o cache.
+PAGE_CACHE_QUERY_PARAMS = ('order', 'page', 'cursor')
+
+
+# Busca (simplemooc.core.search). Sem o FTS5 do SQLite é usado o índice
+# invertido em Python gravado em SEARCH_INDEX_PATH.
+SEARCH_BACKEND = 'simplemooc.core.search.backends.SQLiteFTSBackend'
+#SEARCH_BACKEND = 'simplemooc.core.search.backends.InvertedIndexBackend'
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, 'search_index.pickle')
+
+# Download dos materiais (simplemooc.core.sendfile). Depois de checar a
+# inscrição, o Django pode delegar o envio ao servidor web:
+#   'xsendfile' - Apache (mod_xsendfile) ou lighttpd, cabeçalho X-Sendfile
+#   'nginx'     - X-Accel-Redirect para SENDFILE_URL, uma location interna:
+#                 location /protected/ { internal; alias <MEDIA_ROOT>/; }
+# Com None o próprio Django envia o arquivo (com suporte a Range). Em
+# produção MEDIA_ROOT/lessons não deve ser publicado diretamente.
+SENDFILE_BACKEND = None
+SENDFILE_ROOT = MEDIA_ROOT
+SENDFILE_URL = '/protected/'
+
+# Versões reduzidas das imagens dos cursos (simplemooc.core.renditions),
+# geradas no upload ou no primeiro acesso e gravadas ao lado do original.
+# python manage.py generate_renditions gera todas de novo.
+IMAGE_RENDITIONS = {
+    'card': (400, 250),
+    'detail': (600, 400),
+}
+IMAGE_RENDITION_FORMATS = ('webp', 'jpeg')
+IMAGE_RENDITION_QUALITY = 80
+
 
 # Auth
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'core:home'
 LOGOUT_URL = 'accounts:logout'
 AUTH_USER_MODEL = 'accounts.User'
+
+# Usuário da sessão lido do cache (simplemooc.accounts.backends). O
+# ModelBackend continua na lista para as sessões abertas antes da troca.
+AUTHENTICATION_BACKENDS = [
+    'simplemooc.accounts.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sessões no cache com cópia no banco. Sessões e usuários ficam só no
+# cache compartilhado, sem a camada em memória do processo: um logout ou
+# uma troca de senha valem na hora para todos os processos.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'shared'
+ACCOUNTS_USER_CACHE_ALIAS = 'shared'